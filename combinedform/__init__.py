@@ -1,22 +1,51 @@
 from .combinedform import (
+    CombinedErrorDict,
     CombinedForm,
     CombinedFormMetaclass,
+    DependencyCycleError,
+    DependencyPlan,
     FieldValidationError,
+    NestedFormData,
+    NestedFormsetData,
+    SavePlan,
     Subform,
     SubformError,
+    add_nested_args,
     extract_subform_args,
     get_model_dependencies,
     order_by_dependency,
+    resolve_dependencies,
+    validates,
 )
+from .choicecache import ChoiceCache
+from .fragmentcache import DjangoFragmentCache, LRUFragmentCache
+from .instrumentation import InstrumentEvent, TimingAggregator
+from .querycount import QueryCounter, QueryStats
 
 
 __all__ = [
+    'ChoiceCache',
+    'CombinedErrorDict',
     'CombinedForm',
     'CombinedFormMetaclass',
+    'DependencyCycleError',
+    'DependencyPlan',
+    'DjangoFragmentCache',
     'FieldValidationError',
+    'InstrumentEvent',
+    'LRUFragmentCache',
+    'NestedFormData',
+    'NestedFormsetData',
+    'QueryCounter',
+    'QueryStats',
+    'SavePlan',
     'Subform',
     'SubformError',
+    'TimingAggregator',
+    'add_nested_args',
     'extract_subform_args',
     'get_model_dependencies',
     'order_by_dependency',
+    'resolve_dependencies',
+    'validates',
 ]
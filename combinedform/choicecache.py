@@ -0,0 +1,166 @@
+"""Share the choices of ModelChoiceFields between forms.
+
+Each ``ModelChoiceField`` queries its queryset every time its widget is
+rendered, and again to look up the submitted value. When many forms show
+the same queryset, e.g. in every row of a formset, a :py:class:`ChoiceCache`
+lets them share a single evaluation of it.
+
+"""
+import functools
+
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+class ChoiceCache(object):
+    """Evaluate each distinct queryset once, for all the fields sharing it.
+
+    A cache is meant to live for one request: it doesn't notice when the
+    database changes.
+
+    """
+
+    def __init__(self):
+        self._entries = {}  # (model, db, sql, params) -> _Entry
+        self._by_queryset = {}  # id(queryset) -> (queryset, _Entry)
+
+    def share(self, form):
+        """Make the ModelChoiceFields of a form or formset use this cache.
+
+        The rows of a formset use it as they're built.
+
+        """
+        if isinstance(form, forms.formsets.BaseFormSet):
+            form._construct_form = functools.partial(
+                _construct_form, form._construct_form, self)
+        elif isinstance(form, forms.BaseForm):
+            for field in form.fields.values():
+                if _can_share(field):
+                    self.share_field(field)
+
+    def share_field(self, field):
+        """Make a ModelChoiceField get its choices from this cache."""
+        entry = self._entry(field.queryset)
+        if entry is None:
+            return
+        field.widget.choices = entry.choices(field)
+        if not isinstance(field, forms.ModelMultipleChoiceField):
+            # the entry is looked up again on use, as views often narrow
+            # field.queryset once the form is built
+            field.to_python = functools.partial(_to_python, field, self)
+
+    def _entry(self, queryset):
+        """Get the cache entry for ``queryset``, or None if it can't have one.
+        """
+        try:
+            return self._by_queryset[id(queryset)][1]
+        except KeyError:
+            pass
+        try:
+            sql, params = queryset.query.sql_with_params()
+            key = (queryset.model, queryset.db, sql, tuple(params))
+            hash(key)
+        except Exception:  # e.g. an empty result, or unhashable params
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(queryset)
+        # keep the queryset alive so its id isn't reused
+        self._by_queryset[id(queryset)] = (queryset, entry)
+        return entry
+
+
+class _Entry(object):
+    """The objects in one queryset, evaluated when first needed."""
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self._objects = None
+        self._choices = {}
+        self._lookups = {}
+
+    @property
+    def objects(self):
+        if self._objects is None:
+            self._objects = list(self.queryset)
+        return self._objects
+
+    def choices(self, field):
+        """Get a field's widget choices, shared with similar fields."""
+        key = (type(field), field.empty_label, field.to_field_name)
+        try:
+            return self._choices[key]
+        except KeyError:
+            pass
+        choices = self._choices[key] = _LazyChoices(self, field)
+        return choices
+
+    def lookup(self, field_name):
+        """Get a dict from the values of a model field to the objects."""
+        try:
+            return self._lookups[field_name]
+        except KeyError:
+            pass
+        attname = self.queryset.model._meta.get_field(field_name).attname
+        lookup = self._lookups[field_name] = {
+            getattr(obj, attname): obj for obj in self.objects}
+        return lookup
+
+
+class _LazyChoices(object):
+    """A field's choices, worked out from the cached objects when first used.
+
+    Widgets only iterate over their choices, so they can use this instead of
+    a list, and the queryset isn't evaluated unless a widget is rendered.
+
+    """
+
+    def __init__(self, entry, field):
+        self.entry = entry
+        self.field = field
+        self._choices = None
+
+    def __iter__(self):
+        if self._choices is None:
+            choices = []
+            if self.field.empty_label is not None:
+                choices.append(('', self.field.empty_label))
+            for obj in self.entry.objects:
+                choices.append((self.field.prepare_value(obj),
+                                self.field.label_from_instance(obj)))
+            self._choices = choices
+        return iter(self._choices)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+def _can_share(field):
+    """Check if a field's choices can come from a ChoiceCache."""
+    return (isinstance(field, forms.ModelChoiceField) and
+            not hasattr(field, '_choices') and  # choices set by hand
+            not field.widget.is_hidden)  # e.g. formsets' primary key fields
+
+
+def _construct_form(construct_form, cache, i, **kwargs):
+    """Build a formset row, then make it use ``cache``."""
+    form = construct_form(i, **kwargs)
+    cache.share(form)
+    return form
+
+
+def _to_python(field, cache, value):
+    """Look up a ModelChoiceField's value in its ChoiceCache entry."""
+    entry = cache._entry(field.queryset)
+    if entry is None:
+        return type(field).to_python(field, value)
+    if value in field.empty_values:
+        return None
+    model_field = (field.queryset.model._meta.get_field(field.to_field_name)
+                   if field.to_field_name else field.queryset.model._meta.pk)
+    try:
+        key = model_field.to_python(value)
+        return entry.lookup(model_field.name)[key]
+    except (ValidationError, KeyError, TypeError):
+        raise ValidationError(field.error_messages['invalid_choice'],
+                              code='invalid_choice')
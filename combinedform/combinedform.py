@@ -1,13 +1,36 @@
 """A utility class for combining several independent Django forms."""
-from collections import defaultdict, Iterable
+import asyncio
+from collections import defaultdict, deque, namedtuple, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import functools
+import json
+import random
 import sys
+import threading
+import time
+import types
 
 from django import forms
-from django.core.exceptions import ValidationError
-from django.db.models import ForeignKey
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import (connections, DatabaseError, IntegrityError, router,
+                       transaction)
+from django.db.models import ForeignKey, Model
+from django.db.models.deletion import Collector
+from django.db.models.signals import class_prepared
 from django import utils
 
+from . import instrumentation
+from .choicecache import ChoiceCache
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # Django before 3.0
+    sync_to_async = None
+
 
 class SubformError(Exception):
     """An error occured when interacting with a subform."""
@@ -35,6 +58,162 @@ class FieldValidationError(Exception):
         self.error_dict = error_dict
 
 
+class CombinedErrorDict(dict):
+    """The errors of a CombinedForm, as given by ``CombinedForm.errors``.
+
+    Maps subform names to the subforms' own errors, so it looks like it
+    always has. Errors which don't belong to any subform field, i.e. those
+    raised by validators and formsets' non-form errors, are kept as
+    ``(subform name or None, ValidationError)`` pairs in
+    :py:attr:`non_field_errors`, and only show up in the JSON data.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.non_field_errors = []
+
+    def get_json_data(self, escape_html=False):
+        """Get the errors as plain dicts and lists, ready for JSON.
+
+        Each error is a dict with its ``message``, ``code`` and ``params``.
+        Forms give a dict of lists of errors per field, formsets give a list
+        of those, one per row. Errors from validators and formsets'
+        non-form errors are listed under ``'__all__'``, each with the name of
+        its ``subform``, or ``None`` for the CombinedForm itself.
+
+        Messages are taken straight from the ``ValidationError`` objects,
+        without rendering any error lists.
+
+        """
+        data = {}
+        for formname, form_errors in self.items():
+            if isinstance(form_errors, dict):
+                data[formname] = _errors_json_data(form_errors, escape_html)
+            else:
+                data[formname] = [_errors_json_data(row, escape_html)
+                                  for row in form_errors]
+        if self.non_field_errors:
+            data[NON_FIELD_ERRORS] = [
+                dict(_error_json_data(error, escape_html), subform=formname)
+                for formname, error in self.non_field_errors]
+        return data
+
+    def as_json(self, escape_html=False):
+        """Get :py:meth:`get_json_data` as a JSON string."""
+        return json.dumps(self.get_json_data(escape_html),
+                          cls=_ErrorJSONEncoder)
+
+
+def _errors_json_data(errors, escape_html):
+    """Get the JSON data for a form's dict of errors."""
+    data = {}
+    for field, errorlist in errors.items():
+        if hasattr(errorlist, 'as_data'):
+            error_list = errorlist.as_data()
+        else:
+            error_list = ValidationError(errorlist).error_list
+        data[field] = [_error_json_data(error, escape_html)
+                       for error in error_list]
+    return data
+
+
+def _error_json_data(error, escape_html):
+    """Get the JSON data for a ValidationError with a single message."""
+    message = error.message
+    if error.params:
+        message %= error.params
+    message = str(message)
+    if escape_html:
+        message = utils.html.escape(message)
+    return {'message': message, 'code': error.code or '',
+            'params': error.params or {}}
+
+
+class _ErrorJSONEncoder(DjangoJSONEncoder):
+    """Encode error params, falling back to str() for unknown types."""
+
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+class DependencyCycleError(Exception):
+    """Models depend on each other in a way no save order can satisfy."""
+
+    def __init__(self, models):
+        """Signal a cycle of non-nullable ForeignKeys.
+
+        :type  models: list
+        :param models: The models which make up the cycle(s).
+
+        """
+        self.models = models
+        names = ", ".join(m.__name__ for m in models)
+        super(DependencyCycleError, self).__init__(
+            "Circular non-nullable ForeignKeys between: " + names)
+
+
+DependencyPlan = namedtuple('DependencyPlan', ['order', 'deferred'])
+DependencyPlan.__doc__ = """The result of :py:func:`resolve_dependencies`.
+
+``order`` is a tuple of models, dependencies first. ``deferred`` is a tuple
+of ``(model, field)`` pairs naming the ForeignKeys which have to be filled in
+after every model is saved.
+
+"""
+
+
+SavePlan = namedtuple('SavePlan', ['order', 'formnames', 'links', 'deferred',
+                                   'owners', 'kinds'])
+SavePlan.__doc__ = """How a CombinedForm class saves its subforms.
+
+See :py:meth:`CombinedForm.get_save_plan`. All attributes are read-only.
+
+``order``
+    A tuple of models, in the order they are saved.
+
+``formnames``
+    A mapping from each model to the name of the subform which edits it.
+
+``links``
+    A mapping from each model to a tuple of its ForeignKey fields which get
+    pointed at a previously saved instance before saving.
+
+``deferred``
+    A tuple of ``(model, field)`` pairs for the ForeignKeys which are filled
+    in after every model is saved. These are the ForeignKeys
+    :py:func:`resolve_dependencies` defers which point at another model
+    edited by a single form. ForeignKeys from a model to itself, and to a
+    model edited by a formset, are left as the subforms set them.
+
+``owners``
+    A frozenset of the models whose primary keys are needed to link other
+    instances.
+
+``kinds``
+    A mapping from each subform name to ``'form'`` or ``'formset'``.
+
+"""
+
+
+# save plans hold on to model classes and fields, so they are thrown away
+# whenever models get (re)registered
+_registry_version = 0
+
+
+def _expire_save_plans(**kwargs):
+    global _registry_version
+    if kwargs.get('setting', 'INSTALLED_APPS') == 'INSTALLED_APPS':
+        _registry_version += 1
+
+
+class_prepared.connect(_expire_save_plans)
+setting_changed.connect(_expire_save_plans)
+
+
 class Subform(object):
     """A container for a form constructor to include in a CombinedForm.
 
@@ -55,9 +234,21 @@ class Subform(object):
         self.args = args
         self.kwargs = kwargs
         self.formclass = subform_class
+        self.name = None  # set by CombinedFormMetaclass
         self._ordering = Subform.__creation_counter
         Subform.__creation_counter += 1
 
+    def __get__(self, instance, owner):
+        """Build a CombinedForm's subform the first time it's accessed.
+
+        Once built, the subform is stored in the instance's ``__dict__``,
+        which takes precedence over this method.
+
+        """
+        if instance is None:
+            return self
+        return instance._build_subform(self.name)
+
     def make_instance(self, *args, **kwargs):
         """Create a new instance of this subform."""
         formargs = self.args + args
@@ -85,10 +276,13 @@ class CombinedFormMetaclass(type):
 
         # scan class definition for Subform instances
         forms = {}
+        subform_defs = {}
         ordernums_names = []  # use to sort Subforms by ordering number
         for attrname, attrval in dct.items():
             if isinstance(attrval, Subform):
+                attrval.name = attrname
                 forms[attrname] = attrval.formclass
+                subform_defs[attrname] = attrval
                 ordernums_names.append((attrval._ordering, attrname))
 
         # keep track of subform declaration order
@@ -108,18 +302,69 @@ class CombinedFormMetaclass(type):
 
             # get all forms from parent class
             forms.update(parent._forms)
+            subform_defs = dict(parent._subform_defs, **subform_defs)
 
             # preserve form order from parent class
-            formnames = parent._formnames + formnames
+            formnames = list(parent._formnames) + formnames
 
         # TODO: delete the `_forms` attribute, it is unneeded and prevents
         # users from overriding form factories if they need to
         cls._forms = forms
-        cls._formnames = formnames
+        cls._subform_defs = types.MappingProxyType(subform_defs)
+        cls._formnames = tuple(OrderedDict.fromkeys(formnames))
+
+        # lookup table for self['name'] and friends, so they needn't scan
+        # _formnames
+        cls._formindex = types.MappingProxyType(
+            {name: i for i, name in enumerate(cls._formnames)})
+
+        # cache of how 'subform__arg' kwargs get routed; see
+        # extract_subform_args
+        cls._kwarg_routes = {}
+
         super(CombinedFormMetaclass, cls).__init__(name, bases, dct)
 
 
-def extract_subform_args(raw_kwargs, subform_names):
+def validates(*inputs):
+    """Declare which parts of a CombinedForm a validator reads.
+
+    Each input is a subform name, or a ``'subform.field'`` name. A declared
+    validator only runs once all its inputs are valid, even if other parts
+    of the form aren't, and isn't run again unless the cleaned values of its
+    inputs change. See :py:meth:`CombinedForm.forms_valid`.
+
+    Example:
+
+    ::
+
+        @validates('dates.start', 'dates.end')
+        def check_dates(combinedform):
+            ...
+
+    """
+    def decorator(validator):
+        validator.combinedform_inputs = tuple(inputs)
+        return validator
+    return decorator
+
+
+def _is_declared(validator):
+    """Check if a validator's inputs were declared with :py:func:`validates`."""
+    return isinstance(getattr(validator, 'combinedform_inputs', None), tuple)
+
+
+def _validator_name(validator):
+    """Name a validator for instrumentation events."""
+    return getattr(validator, '__name__', None) or repr(validator)
+
+
+# what CombinedForm._plan_validator() can decide to do with a validator
+_RUN = object()
+_SKIP = object()
+_THREAD = object()  # only in aforms_valid(): runs on a worker thread
+
+
+def extract_subform_args(raw_kwargs, subform_names, routes=None):
     """Sort kwargs into dicts organized by intended subform.
 
     This will only remove those arguments with keys matching the
@@ -133,7 +378,14 @@ def extract_subform_args(raw_kwargs, subform_names):
     :param raw_kwargs: A dict with various ``'form__foo': 'bar'`` entries.
 
     :type  subform_names: seq
-    :param subform_names: Subform names to recognize.
+    :param subform_names:
+        Subform names to recognize. A set or mapping makes lookups fastest.
+
+    :type  routes: dict
+    :param routes:
+        A cache of how each kwarg name was split up, shared between calls with
+        the same ``subform_names``. Kwarg names come from code rather than
+        user input, so this stays small.
 
     :rtype:  dict of kwarg dicts
 
@@ -146,15 +398,26 @@ def extract_subform_args(raw_kwargs, subform_names):
         True
 
     """
-    subform_args = defaultdict(dict)
-    for raw_argname, argval in list(raw_kwargs.items()):
-        if not '__' in raw_argname:
-            continue
-        formname, argname = raw_argname.split('__', 1)  # 1 is maxsplit
-        if formname in subform_names:
-            subform_args[formname][argname] = argval
-            del raw_kwargs[raw_argname]
-    return dict(subform_args)
+    if routes is None:
+        routes = {}
+
+    subform_args = {}
+    for raw_argname in list(raw_kwargs):
+        try:
+            route = routes[raw_argname]
+        except KeyError:
+            formname, sep, argname = raw_argname.partition('__')
+            if sep and formname in subform_names:
+                route = (formname, argname)
+            else:
+                route = None
+            routes[raw_argname] = route
+
+        if route is not None:
+            formname, argname = route
+            args = subform_args.setdefault(formname, {})
+            args[argname] = raw_kwargs.pop(raw_argname)
+    return subform_args
 
 
 def add_initial_args(initial, arg_dict):
@@ -172,6 +435,179 @@ def add_initial_args(initial, arg_dict):
         arg_dict[subform]['initial'] = subform_initial
 
 
+def add_nested_args(subforms, data, files, arg_dict):
+    """Sort nested subform data into ``arg_dict``.
+
+    ``data`` and ``files`` map subform names to a dict of values for a form,
+    or a list of such dicts for a formset. Each subform gets ``data`` and
+    ``files`` views which answer a subform's prefixed lookups straight from
+    those values, without copying them, as if they had been sent as a flat
+    form submission. Formsets' management form data is made up from the
+    rows; see :py:class:`NestedFormsetData`.
+
+    :type  subforms: dict
+    :param subforms: Subform names and :py:class:`Subform` definitions.
+
+    :raises ValidationError:
+        If ``data`` or ``files`` isn't shaped like that, or if a model
+        formset's rows which have a primary key don't all come before its new
+        rows. The errors are keyed by subform name, or by ``'__all__'`` if
+        ``data`` or ``files`` itself isn't a dict.
+
+    :returns: None
+
+    """
+    errors = {}
+    for values in (data, files):
+        if values is not None and not isinstance(values, Mapping):
+            errors[NON_FIELD_ERRORS] = ValidationError(
+                "Expected an object mapping subform names to their data.",
+                code='invalid')
+    if errors:
+        raise ValidationError(errors)
+
+    for name, subform in subforms.items():
+        kw = arg_dict.setdefault(name, {})
+        prefix = subform.prefix or kw.get('prefix')  # as in make_instance()
+        formclass = subform.formclass
+        if (isinstance(formclass, type) and
+                issubclass(formclass, forms.formsets.BaseFormSet)):
+            prefix = prefix or formclass.get_default_prefix()
+            model = getattr(formclass, 'model', None)
+            pk_name = model._meta.pk.name if model is not None else None
+            rows = data.get(name, ())
+            file_rows = files.get(name, ()) if files is not None else ()
+            error = (_nested_rows_error(rows, pk_name) or
+                     _nested_rows_error(file_rows))
+            if error is None:
+                kw['data'] = NestedFormsetData(rows, prefix, pk_name)
+                if files is not None:
+                    kw['files'] = NestedFormsetData(file_rows, prefix)
+        else:
+            prefix = prefix or getattr(formclass, 'prefix', None)
+            values = data.get(name, {})
+            file_values = files.get(name, {}) if files is not None else {}
+            error = (_nested_values_error(values) or
+                     _nested_values_error(file_values))
+            if error is None:
+                kw['data'] = NestedFormData(values, prefix)
+                if files is not None:
+                    kw['files'] = NestedFormData(file_values, prefix)
+        if error is not None:
+            errors[name] = ValidationError(error, code='invalid')
+    if errors:
+        raise ValidationError(errors)
+
+
+def _nested_values_error(values):
+    """Check the nested values of a form.
+
+    :returns: An error message, or None if they're a dict.
+
+    """
+    if not isinstance(values, Mapping):
+        return "Expected an object of field values."
+    return None
+
+
+def _nested_rows_error(rows, pk_name=None):
+    """Check the nested rows of a formset; see :py:class:`NestedFormsetData`.
+
+    :returns: An error message, or None if they're fine.
+
+    """
+    if (not isinstance(rows, (list, tuple)) or
+            not all(isinstance(row, Mapping) for row in rows)):
+        return "Expected a list of objects of field values, one per row."
+    try:
+        _count_initial(rows, pk_name)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+class NestedFormData(Mapping):
+    """A form's nested values, looked up by prefixed field names."""
+
+    def __init__(self, values, prefix=None):
+        self._values = values
+        self.prefix = prefix + '-' if prefix else ''
+
+    def __getitem__(self, key):
+        if not key.startswith(self.prefix):
+            raise KeyError(key)
+        return self._values[key[len(self.prefix):]]
+
+    def __iter__(self):
+        return (self.prefix + key for key in self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class NestedFormsetData(Mapping):
+    """A formset's list of nested rows, looked up by prefixed field names.
+
+    The management form's data is made up from the rows: all rows are sent,
+    and for model formsets the leading rows which have a primary key are the
+    initial forms, editing existing objects.
+
+    :raises ValueError:
+        If a row with a primary key comes after a row without one. Django
+        would take it for a new object, and save a copy of the existing one.
+
+    """
+
+    def __init__(self, rows, prefix, pk_name=None):
+        self.rows = rows
+        self.prefix = prefix + '-'
+        self.management = {
+            forms.formsets.TOTAL_FORM_COUNT: len(rows),
+            forms.formsets.INITIAL_FORM_COUNT: _count_initial(rows, pk_name),
+            forms.formsets.MIN_NUM_FORM_COUNT: 0,
+            forms.formsets.MAX_NUM_FORM_COUNT: len(rows),
+        }
+
+    def __getitem__(self, key):
+        if not key.startswith(self.prefix):
+            raise KeyError(key)
+        key = key[len(self.prefix):]
+        if key in self.management:
+            return self.management[key]
+        index, _, field = key.partition('-')
+        if not index.isdigit() or int(index) >= len(self.rows):
+            raise KeyError(key)
+        return self.rows[int(index)][field]
+
+    def __iter__(self):
+        for key in self.management:
+            yield self.prefix + key
+        for index, row in enumerate(self.rows):
+            for field in row:
+                yield '{}{}-{}'.format(self.prefix, index, field)
+
+    def __len__(self):
+        return len(self.management) + sum(len(row) for row in self.rows)
+
+
+def _count_initial(rows, pk_name):
+    """Count the leading rows which have a value for ``pk_name``.
+
+    :raises ValueError: If any later row has a value for it too.
+
+    """
+    if pk_name is None:
+        return 0
+    has_pk = [row.get(pk_name) not in (None, '') for row in rows]
+    count = has_pk.index(False) if False in has_pk else len(has_pk)
+    if any(has_pk[count:]):
+        raise ValueError(
+            "Row {} has a {!r} but comes after a new row; rows editing "
+            "existing objects must come first".format(
+                has_pk.index(True, count), pk_name))
+    return count
+
+
 # copied from recent Django source on Github
 def add_error(form, error):
     """
@@ -248,11 +684,145 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
         a :class:`combinedform.FieldValidationError` to highlight a particular
         field in a particular subform.
 
+        A validator can also be a coroutine function. :py:meth:`ais_valid`
+        awaits all of those at the same time.
+
+    ``lazy_subforms``
+
+        If true, subforms are only built when they're first needed, e.g. by
+        ``combinedform.form_a``, ``combinedform['form_a']`` or
+        :py:meth:`is_valid`. Useful when a view only touches a few subforms.
+
+    ``validation_executor``
+
+        Validate the subforms concurrently instead of one after another. Set
+        it to a ``concurrent.futures.Executor``, or to an int to use a new
+        thread pool with that many threads for each validation. Subforms
+        validated on other threads make their queries on those threads' own
+        database connections.
+
+    ``bulk_save``
+
+        If true, :py:meth:`save` inserts the new instances of each formset
+        subform with a single ``bulk_create`` call instead of saving them one
+        at a time. See the ``bulk`` parameter of :py:meth:`save`.
+
+    ``bulk_batch_size``
+
+        The ``batch_size`` given to ``bulk_create`` when ``bulk_save`` is
+        enabled. ``None`` lets Django pick.
+
+    ``save_changed_only``
+
+        If true, :py:meth:`save` writes only the changed fields of existing
+        instances, and skips unchanged ones. See the ``changed_only``
+        parameter of :py:meth:`save`.
+
+    ``atomic_save``
+
+        Whether :py:meth:`save` makes all its writes in one database
+        transaction. True by default. See the ``atomic`` parameter of
+        :py:meth:`save`.
+
+    ``savepoint_per_subform``
+
+        If true, :py:meth:`save` writes each subform's instances inside a
+        savepoint of their own. See the ``savepoints`` parameter of
+        :py:meth:`save`.
+
+    ``save_lock``
+
+        If true, :py:meth:`save` locks the rows of all the existing instances
+        it's about to write before writing any of them. See the ``lock``
+        parameter of :py:meth:`save`.
+
+    ``save_retries``
+
+        How many times :py:meth:`save` starts over when the database reports
+        a deadlock or a serialization failure; see
+        :py:meth:`is_transient_error`. 0 by default. Only saves made in
+        their own transaction are retried: not those made while the caller
+        has a transaction open, e.g. with ``ATOMIC_REQUESTS``, since the
+        failure may have rolled back the caller's earlier writes too.
+
+    ``save_retry_delay``
+
+        How many seconds to wait before the first retry. The wait doubles for
+        each retry after that, and is shortened by a random amount of up to
+        half so that clashing saves don't retry in step.
+
+    ``natural_keys``
+
+        A dict from subform names to tuples of field names which identify
+        an instance of the subform's model, e.g.
+        ``{'lines': ('order', 'sku')}``. The fields should have a unique
+        constraint in the database. When ``save_upsert`` is on, model
+        validation of those subforms doesn't check whether a natural key is
+        already taken, since the save updates the row which has it.
+        Otherwise they're validated as usual.
+
+    ``save_upsert``
+
+        If true, :py:meth:`save` updates the rows which already have the
+        natural keys of new instances instead of inserting duplicates. See
+        the ``upsert`` parameter of :py:meth:`save`.
+
+    ``fragment_cache``
+
+        A cache from :py:mod:`combinedform.fragmentcache` to keep the rendered
+        HTML of unbound subforms in, so :py:meth:`as_p` and friends don't
+        render the same empty form again on every request. Call
+        :py:meth:`invalidate_fragments` when the subforms' markup changes for
+        reasons :py:meth:`fragment_key` doesn't know about.
+
+    ``share_choices``
+
+        If true, all ``ModelChoiceField`` fields in the subforms, including
+        every row of a formset, share one :py:class:`ChoiceCache`. Each
+        distinct queryset is then queried once, for rendering and for looking
+        up submitted values, instead of once per field.
+
+    ``instruments``
+
+        Hooks to time this class's steps with, on top of those installed for
+        all CombinedForms; see :py:mod:`combinedform.instrumentation`.
+
     """
 
     validators = tuple()  # default to no validators
 
-    def __init__(self, *args, initial=None, **kwargs):
+    lazy_subforms = False
+
+    validation_executor = None
+
+    bulk_save = False
+
+    bulk_batch_size = None
+
+    save_changed_only = False
+
+    atomic_save = True
+
+    savepoint_per_subform = False
+
+    save_lock = False
+
+    save_retries = 0
+
+    save_retry_delay = 0.05
+
+    natural_keys = {}
+
+    save_upsert = False
+
+    fragment_cache = None
+
+    instruments = ()
+
+    share_choices = False
+
+    def __init__(self, *args, initial=None, lazy=None, choice_cache=None,
+                 **kwargs):
         """Construct all subforms.
 
         Passes ``*args`` and ``**kwargs`` to all subforms, except for
@@ -284,30 +854,84 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
                 YourCombinedForm(a__initial={'foo': 'bar'},
                                  b__initial={'fizz': 'buzz'})
 
+        :type  lazy: bool
+        :param lazy:
+            Whether to put off building each subform until it is first
+            accessed. ``None`` uses the ``lazy_subforms`` option.
+
+        :type  choice_cache: combinedform.ChoiceCache
+        :param choice_cache:
+            A cache for the choices of all ``ModelChoiceField`` fields in the
+            subforms, e.g. to share with other forms in the same request.
+            ``None`` makes a new one if the ``share_choices`` option is set.
+
         """
-        subform_args = extract_subform_args(kwargs, list(self.keys()))
+        self._errors = []  # ValidationErrors raised by validators
+        self._validity = None  # see is_valid()
+        self._validator_results = {}  # see forms_valid()
+
+        if lazy is None:
+            lazy = self.lazy_subforms
+        if choice_cache is None and self.share_choices:
+            choice_cache = ChoiceCache()
+        self.choice_cache = choice_cache
+
+        subform_args = extract_subform_args(kwargs, self._formindex,
+                                            self._kwarg_routes)
         add_initial_args(initial or {}, subform_args)
 
-        for subform_name in list(self.keys()):
+        # remember each subform's constructor arguments until it's built
+        self._subform_args = args
+        self._subform_kwargs = {}
+        for subform_name in self._formnames:
             # check if we need to send subform args
             if subform_name in subform_args:
                 kw = subform_args[subform_name]
                 kw.update(kwargs)
             else:
                 kw = kwargs
+            self._subform_kwargs[subform_name] = kw
 
-            form_factory = self[subform_name].make_instance
-            try:
+        if not lazy:
+            for subform_name in self._formnames:
+                self._build_subform(subform_name)
+
+    def _build_subform(self, name):
+        """Construct the subform called ``name`` and store it on ``self``."""
+        try:
+            kw = self._subform_kwargs[name]
+        except (AttributeError, KeyError):
+            raise AttributeError("Subform '{}' can't be built".format(name))
+
+        args = self._subform_args
+        form_factory = self._subform_defs[name].make_instance
+        try:
+            with self._instrument('init', name):
                 form_inst = form_factory(*args, **kw)
-                setattr(self, subform_name, form_inst)
-            except Exception as e:
-                msg = ("Error creating {name} with args {args} and kwargs "
-                       "{kwargs}: {msg}")
-                error = msg.format(name=subform_name, args=args, kwargs=kw,
-                                   msg=repr(e))
-                raise SubformError(error).with_traceback(sys.exc_info()[2])
+                if self.choice_cache is not None:
+                    self.choice_cache.share(form_inst)
+                if self.save_upsert and name in self.natural_keys:
+                    _allow_taken_keys(form_inst, self.natural_keys[name])
+        except Exception as e:
+            msg = ("Error creating {name} with args {args} and kwargs "
+                   "{kwargs}: {msg}")
+            error = msg.format(name=name, args=args, kwargs=kw, msg=repr(e))
+            raise SubformError(error).with_traceback(sys.exc_info()[2])
+
+        setattr(self, name, form_inst)
+        del self._subform_kwargs[name]
+        return form_inst
 
-        self._errors = []  # for validation errors
+    def _instrument(self, phase, name):
+        """Get a context manager which times a step for the hooks.
+
+        See :py:mod:`combinedform.instrumentation`.
+
+        """
+        if not self.instruments and not instrumentation.hooks:
+            return instrumentation.NULL_STEP
+        return instrumentation.Step(type(self), phase, name,
+                                    self.instruments)
 
     def keys(self):
         """Get a list of the names of all forms in this CombinedForm."""
@@ -315,8 +939,14 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
 
     @property
     def errors(self):
-        """Get all errors from subforms."""
-        errors = {}
+        """Get all errors from subforms.
+
+        :rtype: CombinedErrorDict
+
+        """
+        errors = CombinedErrorDict()
+        for error in self._errors:
+            errors.non_field_errors.append((None, error))
         for formname, form in self.iteritems():
             form_errors = form.errors
 
@@ -324,6 +954,8 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
             # three forms in the formset. This means the combinedform errors
             # will be True. So sniff out that case and eliminate it
             if isinstance(form, forms.formsets.BaseFormSet):
+                for error in form.non_form_errors().as_data():
+                    errors.non_field_errors.append((formname, error))
                 if not any(form_errors):
                     form_errors = None
             if form_errors:
@@ -332,14 +964,14 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
 
     def __getitem__(self, k):
         """Allow access of subforms by self['subform_name'] syntax."""
-        if k in list(self.keys()):
+        if k in self._formindex:
             return getattr(self, k)
         else:
             raise AttributeError("No subform with name '{}'".format(k))
 
     def __iter__(self):
         """Like dict, yield all keys to this CombinedForm instance."""
-        return iter(list(self.keys()))
+        return iter(self._formnames)
 
     def __unicode__(self):
         """Show all subforms with markup."""
@@ -347,8 +979,133 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
 
     def as_p(self):
         """Return all subforms as_p combined."""
-        all_forms = ''.join(form.as_p() for form in list(self.values()))
-        return utils.safestring.mark_safe(all_forms)
+        return utils.safestring.mark_safe(''.join(self.iter_render('p')))
+
+    def as_table(self):
+        """Return all subforms as_table combined."""
+        return utils.safestring.mark_safe(''.join(self.iter_render('table')))
+
+    def as_ul(self):
+        """Return all subforms as_ul combined."""
+        return utils.safestring.mark_safe(''.join(self.iter_render('ul')))
+
+    def as_div(self):
+        """Return all subforms as_div combined."""
+        return utils.safestring.mark_safe(''.join(self.iter_render('div')))
+
+    def iter_render(self, style='p'):
+        """Render all subforms piece by piece.
+
+        Each form, and each formset's management form and rows, is yielded as
+        soon as it's rendered, so the output can be sent with a
+        ``StreamingHttpResponse`` without building the whole page first.
+        Joined together, the pieces are the same as e.g. :py:meth:`as_p`.
+
+        :type  style: str
+        :param style: One of ``'p'``, ``'table'``, ``'ul'`` or ``'div'``.
+
+        """
+        if style not in RENDER_STYLES:
+            raise ValueError("Unknown render style '{}'".format(style))
+        cache = self.fragment_cache
+        namespace = self._fragment_namespace()
+        for formname, form in self.iteritems():
+            key = None
+            if cache is not None:
+                key = self.fragment_key(formname, form, style)
+            if key is None:
+                yield from self._iter_render_subform(formname, form, style)
+                continue
+            fragment = cache.get(namespace, key)
+            if fragment is None:
+                fragment = ''.join(
+                    self._iter_render_subform(formname, form, style))
+                cache.set(namespace, key, str(fragment))
+            yield utils.safestring.mark_safe(fragment)
+
+    def iter_dirty_fragments(self, style='p'):
+        """Render only the subforms which have errors.
+
+        Yields ``(formname, html)`` for each subform in :py:attr:`errors`,
+        then ``(NON_FIELD_ERRORS, html)`` with :py:attr:`non_field_errors` as a
+        list, if there are any. After a failed submission, a client can swap
+        just these fragments into the page, e.g. using each subform's name as
+        an element id.
+
+        :type  style: str
+        :param style: As for :py:meth:`iter_render`.
+
+        """
+        if style not in RENDER_STYLES:
+            raise ValueError("Unknown render style '{}'".format(style))
+        mark_safe = utils.safestring.mark_safe
+        errors = self.errors
+        for formname, form in self.iteritems():
+            if formname in errors:
+                yield formname, mark_safe(''.join(
+                    self._iter_render_subform(formname, form, style)))
+
+        non_field_errors = self.non_field_errors
+        if non_field_errors:
+            yield (NON_FIELD_ERRORS,
+                   forms.utils.ErrorList(non_field_errors).as_ul())
+
+    def render_invalid(self, style='p'):
+        """Get the fragments from :py:meth:`iter_dirty_fragments` as a dict.
+
+        :rtype: OrderedDict
+
+        """
+        return OrderedDict(self.iter_dirty_fragments(style))
+
+    def fragment_key(self, formname, form, style):
+        """Get the ``fragment_cache`` key for rendering a subform.
+
+        Only unbound forms and formsets are cached, as bound ones may show
+        submitted data or errors; for those, this returns ``None``. The key
+        covers the subform name, style, prefix, initial data and active
+        language. Override this to add anything else a subform's markup
+        depends on, e.g. choices which are set per request.
+
+        :rtype: tuple or None
+
+        """
+        if isinstance(form, forms.formsets.BaseFormSet):
+            if form.is_bound:
+                return None
+            initial = (form.initial, form.total_form_count(),
+                       [row.initial for row in form.forms])
+        elif isinstance(form, forms.BaseForm):
+            if form.is_bound:
+                return None
+            initial = form.initial
+        else:
+            return None
+        return (formname, style, form.prefix, _freeze(initial),
+                utils.translation.get_language())
+
+    @classmethod
+    def invalidate_fragments(cls):
+        """Drop all of this class's rendered subforms from its cache."""
+        if cls.fragment_cache is not None:
+            cls.fragment_cache.invalidate(cls._fragment_namespace())
+
+    @classmethod
+    def _fragment_namespace(cls):
+        return '{}.{}'.format(cls.__module__, cls.__qualname__)
+
+    def _iter_render_subform(self, formname, form, style):
+        """Render one subform piece by piece; see iter_render()."""
+        mark_safe = utils.safestring.mark_safe
+        if isinstance(form, forms.formsets.BaseFormSet):
+            # mirror BaseFormSet.as_p() and friends
+            yield mark_safe(str(form.management_form) + '\n')
+            for i, row in enumerate(form):
+                if i:
+                    yield mark_safe(' ')
+                yield render_form(row, style)
+        else:
+            yield render_form(form, style)
 
     def items(self):
         """Iterate over the subform names and subforms"""
@@ -356,11 +1113,11 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
 
     def iteritems(self):
         """Iterate over the subform names and subforms."""
-        return iter((k, self[k]) for k in list(self.keys()))
+        return ((k, getattr(self, k)) for k in self._formnames)
 
     def itervalues(self):
         """Iterate over the subforms."""
-        return iter(self[k] for k in list(self.keys()))
+        return (getattr(self, k) for k in self._formnames)
 
     def values(self):
         """Get all subforms."""
@@ -371,26 +1128,395 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
 
         This will run all the validator methods defined in ``self.validators``
 
+        A validator declared with :py:func:`validates` runs whenever its
+        inputs are valid, so independent cross-form errors are found at
+        once. It's skipped when any of its inputs is invalid, including when
+        an earlier validator has just reported an error on one, and isn't run
+        again while the cleaned values of its inputs stay the same; its
+        earlier outcome is used.
+
+        Other validators only run while every subform is valid and no earlier
+        validator has failed.
+
+        Validators which are coroutine functions are run to completion on a
+        private event loop; from async code, use :py:meth:`aforms_valid`.
+
         """
+        self._errors = []  # forget errors from any earlier run
+        valid = True
         for validator in self.validators:
-            try:
-                validator(self)
-            except TypeError as e:
-
-                # check if the user gave a non-compliant validator, or if the
-                # user's validator is throwing an exception itself
-                if str(e).startswith(validator.__name__):
-                    raise TypeError(str(e) + ". (Does your validator take"
-                                    "one and only one argument?)")
+            state, outcome = self._plan_validator(validator, valid)
+            if outcome is _RUN:
+                outcome = self._call_validator(validator)
+            valid = self._record_outcome(validator, state, outcome) and valid
+        return valid
+
+    def _call_validator(self, validator):
+        """Run a validator synchronously.
+
+        :returns: The validation exception it raised, or ``None``.
+
+        """
+        try:
+            with self._instrument('validator', _validator_name(validator)):
+                result = validator(self)
+                if asyncio.iscoroutine(result):
+                    _run_coroutine(result)
+        except (TypeError, ValidationError, FieldValidationError) as e:
+            return e
+        return None
+
+    async def aforms_valid(self):
+        """Check if all forms are valid as a whole, from a coroutine.
+
+        Like :py:meth:`forms_valid`, but validators which are coroutine
+        functions are awaited, all at the same time. Plain validators may
+        block, e.g. on database queries, so they're called one after another
+        on a worker thread, see :py:func:`_run_in_thread`, while the
+        coroutines run.
+
+        As validators run at the same time, they all see the cleaned data from
+        before any of them failed. Their outcomes are then recorded in the
+        order of ``self.validators``, and the outcome of a validator which
+        :py:meth:`forms_valid` would have skipped, because of the failure of
+        one before it, is dropped.
+
+        """
+        self._errors = []  # forget errors from any earlier run
+        plan = [(validator,) + self._plan_validator(validator)
+                for validator in self.validators]
+
+        # a coroutine, _THREAD, an exception or None per validator
+        outcomes = []
+        threaded = []  # (step, validator) pairs of the plain validators
+        for validator, state, outcome in plan:
+            if outcome is _RUN:
+                step = self._instrument('validator',
+                                        _validator_name(validator))
+                if asyncio.iscoroutinefunction(validator):
+                    try:
+                        outcome = step.run(validator(self))
+                    except Exception as e:
+                        outcome = e
                 else:
-                    raise
-            except ValidationError as e:
-                self._errors.extend(e.messages)
-                return False
-            except FieldValidationError as exc:
-                add_error(self[exc.form_name], exc.error_dict)
-                return False
-        return True
+                    threaded.append((step, validator))
+                    outcome = _THREAD
+            outcomes.append(outcome)
+
+        coroutines = [o for o in outcomes if asyncio.iscoroutine(o)]
+        if threaded:
+            coroutines.append(_run_in_thread(functools.partial(
+                _call_validators, self, threaded)))
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+        threaded_results = iter(results.pop() if threaded else ())
+        results = iter(results)
+
+        valid = True
+        for (validator, state, _), outcome in zip(plan, outcomes):
+            if asyncio.iscoroutine(outcome):
+                outcome = next(results)
+            elif outcome is _THREAD:
+                outcome = next(threaded_results)
+            if outcome is not _SKIP and not isinstance(outcome,
+                                                       BaseException):
+                outcome = None
+            if (outcome is not _SKIP and
+                    self._plan_validator(validator, valid)[1] is _SKIP):
+                outcome = _SKIP  # an earlier validator has just failed
+            valid = self._record_outcome(validator, state, outcome) and valid
+        return valid
+
+    def _plan_validator(self, validator, valid=True):
+        """Work out whether a validator needs to run, just before it would.
+
+        :type  valid: bool
+        :param valid: False if an earlier validator has failed.
+
+        :returns:
+            A ``(state, outcome)`` pair. ``state`` holds the cleaned values of
+            a declared validator's inputs, or ``None``. ``outcome`` is
+            ``_RUN`` if the validator has to run, ``_SKIP`` if it must not, or
+            else the remembered outcome of an earlier run (``None`` or an
+            exception).
+
+        """
+        if not _is_declared(validator):
+            if valid and all(f.is_valid() for f in self.itervalues()):
+                return None, _RUN
+            return None, _SKIP
+
+        state = self._input_state(validator.combinedform_inputs)
+        if state is None:
+            return None, _SKIP
+        earlier = self._validator_results.get(validator)
+        if earlier is not None and earlier[0] == state:
+            return state, earlier[1]
+        return state, _RUN
+
+    def _input_state(self, inputs):
+        """Get the cleaned values of the given validator inputs.
+
+        :type  inputs: seq of str
+        :param inputs: ``'subform'`` or ``'subform.field'`` names.
+
+        :returns: A tuple of values, or ``None`` if any input is invalid.
+
+        """
+        state = []
+        for name in inputs:
+            formname, _, field = name.partition('.')
+            form = self[formname]
+            if not field:
+                if not form.is_valid():
+                    return None
+                state.append(form.cleaned_data)
+            elif isinstance(form, forms.formsets.BaseFormSet):
+                if not form.is_bound or any(field in e for e in form.errors):
+                    return None
+                state.append(tuple(getattr(row, 'cleaned_data', {}).get(field)
+                                   for row in form.forms))
+            else:
+                if not form.is_bound or field in form.errors:
+                    return None
+                state.append(form.cleaned_data.get(field))
+        return tuple(state)
+
+    def _record_outcome(self, validator, state, outcome):
+        """Apply and remember the outcome of a validator.
+
+        :returns: False if the validator failed.
+
+        """
+        if outcome is _SKIP:
+            return True
+        if outcome is not None:
+            self._validator_failed(validator, outcome)
+        if state is not None:
+            self._validator_results[validator] = (state, outcome)
+        return outcome is None
+
+    def _validator_failed(self, validator, exc):
+        """Record the validation error ``exc`` raised by ``validator``.
+
+        Exceptions which aren't validation errors are re-raised.
+
+        """
+        if isinstance(exc, ValidationError):
+            error_list = getattr(exc, 'error_list', None)
+            if error_list is None:  # raised with a dict of errors
+                error_list = [error for errors in exc.error_dict.values()
+                              for error in errors]
+            self._errors.extend(error_list)
+        elif isinstance(exc, FieldValidationError):
+            add_error(self[exc.form_name], exc.error_dict)
+        elif (isinstance(exc, TypeError) and
+              str(exc).startswith(getattr(validator, '__name__', '?'))):
+
+            # the user gave a non-compliant validator, as opposed to the
+            # user's validator throwing a TypeError itself
+            raise TypeError(str(exc) + ". (Does your validator take"
+                            "one and only one argument?)")
+        else:
+            raise exc
+
+    @classmethod
+    def from_nested(cls, data, files=None, **kwargs):
+        """Bind nested data, e.g. parsed from a JSON request body.
+
+        ``data`` maps each subform name to a dict of field values, or for
+        formsets a list of those, one per row:
+
+        ::
+
+            MyCombinedForm.from_nested({
+                'form1': {'name': 'Bob'},
+                'formset1': [{'id': 3, 'qty': 2}, {'qty': 1}],
+            })
+
+        Field names don't need prefixes, and formsets don't need management
+        form data; see :py:func:`add_nested_args`. Subforms missing from
+        ``data`` are bound to no data. Other kwargs are passed on as for the
+        constructor.
+
+        A model formset's rows which edit existing objects, i.e. have a
+        primary key, must come before its new rows.
+
+        :raises ValidationError:
+            If ``data`` or ``files`` is shaped wrong, with an error for each
+            subform at fault. A view can send back its ``message_dict``
+            with a 400 response.
+
+        """
+        subform_args = extract_subform_args(kwargs, cls._formindex,
+                                            cls._kwarg_routes)
+        add_nested_args(cls._subform_defs, data, files, subform_args)
+        for subform, subform_kwargs in subform_args.items():
+            for arg, value in subform_kwargs.items():
+                kwargs['{}__{}'.format(subform, arg)] = value
+        return cls(**kwargs)
+
+    @classmethod
+    def for_instance(cls, root_obj, *args, **kwargs):
+        """Bind the subforms to an existing object and its related objects.
+
+        Starting from ``root_obj``, the ForeignKeys between the subforms'
+        models are followed both ways, as :py:meth:`get_save_plan` finds
+        them:
+
+        - Objects ``root_obj`` refers to, directly or through each other,
+          are loaded with one ``select_related`` query.
+
+        - Objects which refer to an already loaded object are queried per
+          model. Formsets get a queryset, or for inline formsets the parent
+          ``instance``, and forms get the first match.
+
+        Each subform gets its object as ``instance``, or its ``queryset``,
+        unless that argument is given explicitly. Subforms whose model isn't
+        related to ``root_obj`` are left unbound to any object. Other args
+        are passed on as for the constructor.
+
+        """
+        plan = cls.get_save_plan()
+        models = plan.order
+        root_model = type(root_obj)._meta.concrete_model
+
+        # objects root_obj refers to, and how to select_related() them
+        objects = {root_model: root_obj}
+        paths = {root_model: ''}
+        queue = deque([root_model])
+        while queue:
+            model = queue.popleft()
+            for field in get_model_dependencies(model, models):
+                target = field.rel.to
+                if target not in paths:
+                    paths[target] = ('__'.join((paths[model], field.name))
+                                     if paths[model] else field.name)
+                    queue.append(target)
+        related = [path for path in paths.values() if path]
+        if related:
+            loaded = (root_model._default_manager.select_related(*related)
+                      .get(pk=root_obj.pk))
+            for model, path in paths.items():
+                obj = loaded
+                for name in path.split('__') if path else ():
+                    obj = getattr(obj, name) if obj is not None else None
+                if model is not root_model:
+                    objects[model] = obj
+
+        # objects referring to those, as filters relative to a known object
+        filters = {}
+        for model in models:
+            if model in objects or model not in plan.formnames:
+                continue
+            for field in get_model_dependencies(model, models):
+                target = field.rel.to
+                if objects.get(target) is not None:
+                    filters[model] = (field, {field.name: objects[target]})
+                elif target in filters:
+                    filters[model] = (field, {
+                        field.name + '__' + name: value
+                        for name, value in filters[target][1].items()})
+                else:
+                    continue
+                if plan.kinds[plan.formnames[model]] == 'form':
+                    objects[model] = (model._default_manager
+                                      .filter(**filters.pop(model)[1])
+                                      .first())
+                break
+
+        for model, formname in plan.formnames.items():
+            formclass = cls._forms[formname]
+            manager = model._default_manager
+            if plan.kinds[formname] == 'form':
+                if objects.get(model) is not None:
+                    kwargs.setdefault(formname + '__instance', objects[model])
+            elif model in objects:
+                pk = getattr(objects[model], 'pk', None)
+                kwargs.setdefault(formname + '__queryset',
+                                  manager.filter(pk=pk))
+            elif model in filters:
+                field, lookups = filters[model]
+                if (field.name in lookups and
+                        getattr(formclass, 'fk', None) == field):
+                    # inline formsets build their queryset from the parent
+                    kwargs.setdefault(formname + '__instance',
+                                      lookups[field.name])
+                else:
+                    kwargs.setdefault(formname + '__queryset',
+                                      manager.filter(**lookups))
+        return cls(*args, **kwargs)
+
+    @classmethod
+    def validate_partial(cls, data, subform, fields=None, files=None,
+                         **kwargs):
+        """Validate some fields of a single subform.
+
+        This is meant for as-you-type validation, where a client sends one
+        field at a time. Only the named subform is built and only the given
+        fields are cleaned. Form-wide cleaning such as ``clean()`` and model
+        validation is skipped. The only validators run are those declared
+        with :py:func:`validates` to read nothing but the given fields.
+
+        :type  data: dict
+        :param data: The data to bind, as for the constructor.
+
+        :type  subform: str
+        :param subform: The name of the subform to validate. Must be a form,
+                        not a formset.
+
+        :type  fields: seq of str
+        :param fields: The fields to clean. ``None`` means all of them.
+
+        :param files: Uploaded files to bind, as for the constructor.
+
+        Any other keyword arguments are passed on to the constructor.
+
+        :returns:
+            A dict from field names to lists of error messages. Errors from
+            validators which aren't tied to a field are listed under
+            ``'__all__'``. Empty if the fields are valid.
+
+        """
+        args = (data,) if files is None else (data, files)
+        combined = cls(*args, lazy=True, **kwargs)
+        form = combined[subform]
+        if isinstance(form, forms.formsets.BaseFormSet):
+            raise SubformError("Can't validate part of formset "
+                               "'{}'".format(subform))
+
+        if fields is None:
+            fields = list(form.fields)
+        for field in fields:
+            if field not in form.fields:
+                raise ValueError("'%s' has no field named '%s'." %
+                                 (form.__class__.__name__, field))
+
+        # clean just the requested fields
+        form.fields = OrderedDict((f, form.fields[f]) for f in fields)
+        form.cleaned_data = {}
+        form._errors = forms.utils.ErrorDict()
+        form._clean_fields()
+
+        available = {'{}.{}'.format(subform, f) for f in fields}
+        for validator in cls.validators:
+            inputs = getattr(validator, 'combinedform_inputs', None)
+            if (not _is_declared(validator) or not inputs or
+                    not available.issuperset(inputs) or
+                    combined._input_state(inputs) is None):
+                continue
+
+            error = combined._call_validator(validator)
+            other_form = (isinstance(error, FieldValidationError) and
+                          error.form_name != subform)
+            if error is not None and not other_form:
+                combined._validator_failed(validator, error)
+
+        errors = {field: list(errorlist)
+                  for field, errorlist in form.errors.items()}
+        if combined._errors:
+            errors[NON_FIELD_ERRORS] = [message for error in combined._errors
+                                        for message in error]
+        return errors
 
     @property
     def cleaned_data(self):
@@ -412,10 +1538,11 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
         :rtype: list of strings
 
         """
-        errorlist = list(self._errors)  # start with a copy of our own errors
+        # start with our own errors
+        errorlist = [message for error in self._errors for message in error]
 
         # add everyone else's errors
-        for subform in self.values():
+        for subform in self.itervalues():
 
             try:
                 subform.non_field_errors
@@ -441,29 +1568,239 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
         return errorlist
 
     def subforms_valid(self):
-        """Test if all subforms are valid."""
-        for formname, form in self.iteritems():
+        """Test if all subforms are valid.
+
+        If the ``validation_executor`` option is set, the subforms are
+        validated concurrently. Otherwise they're validated one at a time,
+        stopping at the first invalid one.
+
+        """
+        executor = self.validation_executor
+        if executor is None:
+            for formname, form in self.iteritems():
+                try:
+                    with self._instrument('validate', formname):
+                        valid = form.is_valid()
+                    if not valid:
+                        return False
+                except Exception as exc:
+                    self._raise_validation_error(formname, exc)
+            return True
+
+        subforms = list(self.iteritems())  # build any lazy subforms here
+        if isinstance(executor, int):
+            with ThreadPoolExecutor(executor) as pool:
+                return self._subforms_valid_concurrently(pool, subforms)
+        return self._subforms_valid_concurrently(executor, subforms)
+
+    def _subforms_valid_concurrently(self, executor, subforms):
+        """Validate ``subforms`` with ``executor``; see subforms_valid()."""
+        validate = _threaded_validator(self._instrument)
+        futures = [executor.submit(validate, formname, form)
+                   for formname, form in subforms]
+
+        outcomes = []
+        for future in futures:
             try:
-                if not form.is_valid():
-                    return False
+                outcomes.append(future.result())
             except Exception as exc:
-                msg = "Error validating {name}: {msg}".format(name=formname,
-                                                              msg=str(exc))
-                raise SubformError(msg).with_traceback(sys.exc_info()[2])
+                outcomes.append(exc)
+        return self._merge_validation_outcomes(subforms, outcomes)
+
+    async def asubforms_valid(self):
+        """Test if all subforms are valid, from a coroutine.
+
+        With the ``validation_executor`` option set, the subforms are
+        validated on it and awaited. Otherwise :py:meth:`subforms_valid`
+        runs on a worker thread, see :py:func:`_run_in_thread`, since
+        validating a subform may block, e.g. on the queries of its
+        ``ModelChoiceField`` fields or its model's unique checks.
+
+        """
+        executor = self.validation_executor
+        if executor is None:
+            return await _run_in_thread(self.subforms_valid)
+
+        subforms = list(self.iteritems())  # build any lazy subforms here
+        loop = _running_loop()
+        validate = _threaded_validator(self._instrument)
+        pool = (ThreadPoolExecutor(executor) if isinstance(executor, int)
+                else executor)
+        try:
+            outcomes = await asyncio.gather(
+                *[loop.run_in_executor(pool, validate, formname, form)
+                  for formname, form in subforms],
+                return_exceptions=True)
+        finally:
+            if pool is not executor:
+                pool.shutdown(wait=False)
+        return self._merge_validation_outcomes(subforms, outcomes)
+
+    def _merge_validation_outcomes(self, subforms, outcomes):
+        """Combine the outcome of validating each subform.
+
+        ``outcomes`` holds an ``is_valid()`` result or an exception for each
+        of the ``(name, form)`` pairs in ``subforms``. They're looked at in
+        declaration order, so the result doesn't depend on which subform
+        finished first.
+
+        """
+        valid = True
+        for (formname, _), outcome in zip(subforms, outcomes):
+            if isinstance(outcome, Exception):
+                self._raise_validation_error(formname, outcome)
+            valid = outcome and valid
+        return valid
+
+    def _raise_validation_error(self, formname, exc):
+        """Raise ``exc``, raised validating ``formname``, as SubformError."""
+        msg = "Error validating {name}: {msg}".format(name=formname,
+                                                      msg=str(exc))
+        raise SubformError(msg).with_traceback(exc.__traceback__)
+
+    def is_valid(self, revalidate=False):
+        """Test if all subforms, and all CombinedForm validators pass.
+
+        The outcome is remembered, so later calls, including the one made by
+        :py:meth:`save`, don't validate the subforms or run the validators
+        again. Validation starts over if a subform's ``data`` is replaced, or
+        if ``revalidate`` is true.
+
+        :type  revalidate: bool
+        :param revalidate:
+            Ignore any remembered outcome, including those of validators
+            declared with :py:func:`validates`.
+
+        """
+        if not self._forget_validity(revalidate):
+            return self._validity[0]
+
+        subforms_valid = self.subforms_valid()
+        valid = self.forms_valid() and subforms_valid
+        self._remember_validity(valid)
+        return valid
+
+    async def ais_valid(self, revalidate=False):
+        """Test if all subforms and all validators pass, from a coroutine.
+
+        Works like :py:meth:`is_valid`, sharing the remembered outcome. See
+        :py:meth:`asubforms_valid` and :py:meth:`aforms_valid`.
+
+        """
+        if not self._forget_validity(revalidate):
+            return self._validity[0]
+
+        subforms_valid = await self.asubforms_valid()
+        valid = await self.aforms_valid() and subforms_valid
+        self._remember_validity(valid)
+        return valid
 
-        return all(f.is_valid() for f in self.values())
+    def _remember_validity(self, valid):
+        """Store the outcome of is_valid() with the data it applies to."""
+        bound_data = [getattr(form, 'data', None)
+                      for form in self.itervalues()]
+        self._validity = (valid, bound_data)
 
-    def is_valid(self):
-        """Test if all subforms, and all CombinedForm validators pass."""
-        return self.subforms_valid() and self.forms_valid()
+    def _forget_validity(self, revalidate):
+        """Reset validation unless the remembered outcome is still good.
 
-    #TODO: remove this
-    def _modelformmap(self):
-        return {(f.model if hasattr(f, 'model') else f._meta.model):
-                (formname, self[formname])
-                for formname, f in self.iteritems()}
+        :returns: Whether validation has to run.
+
+        """
+        if revalidate:
+            # rerun declared validators too, even if their inputs are the same
+            self._validator_results = {}
+        if self._validity is None:
+            return True
+
+        valid, validated_data = self._validity
+        same_data = all(getattr(form, 'data', None) is data
+                        for form, data in zip(self.itervalues(),
+                                              validated_data))
+        if same_data and not revalidate:
+            return False
+
+        self._reset_validation()
+        return True
+
+    def _reset_validation(self):
+        """Throw away the validation results of this form and its subforms."""
+        self._validity = None
+        self._errors = []
+        for form in self.itervalues():
+            if isinstance(form, forms.formsets.BaseFormSet):
+                for row in form.forms:
+                    row._errors = None
+                form._errors = None
+            elif isinstance(form, forms.BaseForm):
+                form._errors = None
+
+    @classmethod
+    def get_save_plan(cls, subforms=None):
+        """Get the :py:class:`SavePlan` used by :py:meth:`save`.
+
+        The plan doesn't depend on any request data, so it is worked out the
+        first time it's needed and cached on the class. It is rebuilt if the
+        app registry changes.
+
+        :type  subforms: iterable of (name, form) pairs
+        :param subforms:
+            The subforms to inspect when the plan has to be built, as given
+            by :py:meth:`items`. By default the subform classes are inspected,
+            which works for ModelForms and model formsets. Pass subform
+            instances when a subform factory is some other callable.
 
-    def save(self, commit=True, main_form=None):
+        """
+        plan = cls.__dict__.get('_save_plan')
+        if plan is not None and plan[0] == _registry_version:
+            return plan[1]
+
+        if subforms is None:
+            subforms = ((name, cls._forms[name]) for name in cls._formnames)
+
+        formnames = {}
+        kinds = {}
+        for formname, form in subforms:
+            model = form.model if hasattr(form, 'model') else form._meta.model
+            formnames[model] = formname
+
+            formset = forms.formsets.BaseFormSet
+            if isinstance(form, type):
+                is_formset = issubclass(form, formset)
+            else:
+                is_formset = isinstance(form, formset)
+            kinds[formname] = 'formset' if is_formset else 'form'
+
+        dependencies = resolve_dependencies(formnames.keys())
+        order = dependencies.order
+        members = frozenset(order)
+        waiting = frozenset(dependencies.deferred)
+        links = {model: tuple(f for f in get_model_dependencies(model,
+                                                                members)
+                              if (model, f) not in waiting)
+                 for model in order}
+        # there's no single instance to point a deferred link at when it
+        # refers to the model itself or to a formset's rows
+        deferred = tuple(
+            (model, f) for model, f in dependencies.deferred
+            if f.rel.to is not model and
+            kinds[formnames[f.rel.to]] == 'form')
+        owners = frozenset(
+            [f.rel.to for fields in links.values() for f in fields] +
+            [model for model, _ in deferred])
+
+        plan = SavePlan(order=order,
+                        formnames=types.MappingProxyType(formnames),
+                        links=types.MappingProxyType(links),
+                        deferred=deferred,
+                        owners=owners,
+                        kinds=types.MappingProxyType(kinds))
+        cls._save_plan = (_registry_version, plan)
+        return plan
+
+    def save(self, commit=True, main_form=None, bulk=None, batch_size=None,
+             changed_only=None, atomic=None, savepoints=None, using=None,
+             lock=None, upsert=None):
         """Save all subforms.
 
         This will scan the forms for their dependencies and attempt to save
@@ -483,6 +1820,89 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
             - If a non-``None`` falsy value, returns a dict even if
               ``main_form`` is set.
 
+        :type  bulk: bool
+        :param bulk:
+            Whether to insert new formset instances with ``bulk_create``.
+            ``None`` uses the ``bulk_save`` option.
+
+            Bulk inserts skip the model's ``save()`` method and its signals.
+            Instances whose primary keys are needed afterwards (to link a
+            dependent model, or to save many-to-many data) are still saved
+            one at a time unless the database returns ids from bulk inserts.
+
+        :type  batch_size: int
+        :param batch_size:
+            How many rows to insert per query in bulk mode. ``None`` uses the
+            ``bulk_batch_size`` option.
+
+        :type  changed_only: bool
+        :param changed_only:
+            Whether to write only the changed fields of existing instances.
+            ``None`` uses the ``save_changed_only`` option.
+
+            Existing instances are written with just the fields their form
+            reports in ``changed_data``, plus any links to other subforms'
+            instances which changed. Unchanged instances aren't written at
+            all. Each model's edited instances are written with one
+            ``bulk_update`` call where Django provides it, which skips the
+            model's ``save()`` method and its signals.
+
+        Rows of model formset subforms which are marked for deletion are
+        deleted before anything else is written, a model at a time, with
+        dependent models before the models they depend on. See
+        :py:func:`delete_instances`.
+
+        :type  atomic: bool
+        :param atomic:
+            Whether to make all the writes in one transaction, so they're
+            committed together and a failure part way through leaves nothing
+            behind. ``None`` uses the ``atomic_save`` option. Without a
+            ``using`` database, the transaction spans every database the
+            routers send the subforms' models to.
+
+        :type  savepoints: bool
+        :param savepoints:
+            Whether to write each subform's instances inside a savepoint, so
+            a failure rolls back just that subform's writes before the error
+            is raised. Useful with ``atomic`` off, inside a transaction the
+            caller handles. ``None`` uses the ``savepoint_per_subform``
+            option.
+
+        :type  using: str
+        :param using:
+            The alias of the database to write to. ``None`` lets the routers
+            pick one for each model.
+
+        :type  lock: bool
+        :param lock:
+            Whether to lock the rows of the existing instances before writing
+            anything, with one ``select_for_update`` query per model. Models
+            are locked in the save plan's order, and rows in primary key
+            order, so concurrent saves of overlapping object graphs take
+            their locks in the same order instead of deadlocking. Needs a
+            transaction, so ``atomic`` should be on, or the caller should
+            have one open. ``None`` uses the ``save_lock`` option.
+
+        :type  upsert: bool
+        :param upsert:
+            Whether to write the new instances of subforms with
+            ``natural_keys`` as upserts: a row which already has an
+            instance's natural key is updated, and the instance gets its
+            primary key, so resubmitting the same data doesn't create
+            duplicates. Instances of dependent subforms are linked to the
+            rows which were actually written. ``None`` uses the
+            ``save_upsert`` option. See :py:func:`iter_upsert_writes`.
+
+            Validation only lets taken natural keys through when the
+            ``save_upsert`` option is on, so that's the way to turn upserts
+            on. Turning them off here for a class which has it on can make
+            the save fail with ``IntegrityError``.
+
+        Atomic saves which fail with a deadlock or serialization failure are
+        retried as the ``save_retries`` option says, unless a transaction was
+        already open on one of the databases. Before each retry, the
+        instances are put back the way they were before the failed attempt.
+
         :returns:
             Either a ``dict`` with subform names as keys and results of
             ``save()`` as values, or a single specified subform's ``save()``
@@ -492,54 +1912,537 @@ class CombinedForm(object, metaclass=CombinedFormMetaclass):
         """
         assert self.is_valid()
 
-        model_form_map = self._modelformmap()
-        save_order = order_by_dependency(list(model_form_map.keys()))
-        inst_map = {}
-        formname_retval_map = {}
-        for model in save_order:
-            formname, form = model_form_map[model]
-
+        if atomic is None:
+            atomic = self.atomic_save
+        if savepoints is None:
+            savepoints = self.savepoint_per_subform
+        if lock is None:
+            lock = self.save_lock
+        if upsert is None:
+            upsert = self.save_upsert
+
+        retries = 0
+        if commit and atomic and not any(
+                connections[db].in_atomic_block
+                for db in self._save_databases(using)):
+            retries = self.save_retries
+        for attempt in range(retries + 1):
+            if retries:
+                snapshot = _snapshot_instances(self._iter_instances())
             try:
-                inst = form.save(commit=False)
-            except ValidationError as e:
-                msg_tmpl = "Couldn't save {name}: {exc} (errors: {errors})"
-                msg = msg_tmpl.format(name=type(form).__name__, exc=e,
-                                      errors=form.errors)
-                raise SubformError(msg).with_traceback(sys.exc_info()[2])
-
-            inst_map[model] = inst
-
-            # could be working with a form or a formset, so make a single
-            # instance into a singleton list to allow the same code to work in
-            # both cases
-            original_inst = inst
-            if not isinstance(inst, Iterable):
-                inst = [inst]
-
-            # link inst to previously created dependencies
-            for dependency in get_model_dependencies(model, save_order):
-                owner = inst_map[dependency.rel.to]
+                return self._save(commit, main_form, bulk, batch_size,
+                                  changed_only, atomic, savepoints, using,
+                                  lock, upsert)
+            except DatabaseError as e:
+                if attempt == retries or not self.is_transient_error(e):
+                    raise
+            _restore_instances(snapshot)
+            delay = self.save_retry_delay * 2 ** attempt
+            time.sleep(delay * random.uniform(0.5, 1))
 
-                for i in inst:
-                    setattr(i, dependency.name, owner)
+    def is_transient_error(self, exc):
+        """Check if a failed save is worth retrying.
 
-            # save to the database
-            if commit:
-                for i in inst:
-                    i.save()
-                if hasattr(form, 'save_m2m'):  # save other FKs if needed
-                    form.save_m2m()
+        Recognizes deadlocks and serialization failures reported by
+        PostgreSQL and MySQL, lock wait timeouts from MySQL, and SQLite's
+        ``database is locked``. Override this to retry on other errors.
+
+        :type  exc: django.db.DatabaseError
+
+        """
+        cause = exc.__cause__
+        code = (getattr(cause, 'pgcode', None) or
+                getattr(cause, 'sqlstate', None))
+        if code in ('40001', '40P01'):
+            return True
+        args = getattr(cause, 'args', ())
+        if args and args[0] in (1205, 1213):
+            return True
+        return 'database is locked' in str(exc)
+
+    def _save(self, commit, main_form, bulk, batch_size, changed_only,
+              atomic, savepoints, using, lock, upsert):
+        """Make one attempt at :py:meth:`save`."""
+        retvals = {}
+        with contextlib.ExitStack() as stack:
+            if commit and atomic:
+                for db in self._save_databases(using):
+                    stack.enter_context(transaction.atomic(using=db))
+            if commit and lock:
+                self._lock_instances(using)
+            for model, writes in self._iter_save_steps(
+                    retvals, commit, bulk, batch_size, changed_only, using,
+                    upsert):
+                with contextlib.ExitStack() as step_stack:
+                    step_stack.enter_context(
+                        self._instrument('save', _model_label(model)))
+                    if commit and savepoints:
+                        step_stack.enter_context(transaction.atomic(
+                            using=using or router.db_for_write(model)))
+                    for write in writes:
+                        write()
+        return self._main_form_result(retvals, main_form)
+
+    async def asave(self, commit=True, main_form=None, bulk=None,
+                    batch_size=None, changed_only=None, atomic=False,
+                    savepoints=None, using=None, upsert=None):
+        """Save all subforms from a coroutine.
+
+        Works like :py:meth:`save`, in the same order. Each write uses the
+        async variant of the ORM method (``asave()``, ``abulk_create()``)
+        where Django provides one, and runs in a worker thread otherwise.
+
+        Django can't keep a transaction open across awaits, so the writes
+        aren't made in one transaction unless ``atomic`` is true. Then the
+        whole of :py:meth:`save` runs in a worker thread instead, and the
+        ``atomic_save`` option is ignored.
+
+        """
+        assert await self.ais_valid()
+
+        if atomic:
+            return await _run_in_thread(functools.partial(
+                self.save, commit, main_form, bulk, batch_size, changed_only,
+                atomic=True, savepoints=savepoints, using=using,
+                upsert=upsert))
+
+        if upsert is None:
+            upsert = self.save_upsert
+        retvals = {}
+        for model, writes in self._iter_save_steps(
+                retvals, commit, bulk, batch_size, changed_only, using,
+                upsert):
+            await self._instrument('save', _model_label(model)).run(
+                _run_writes_async(writes))
+        return self._main_form_result(retvals, main_form)
+
+    def _iter_instances(self):
+        """Iterate over the instances of all model form and formset rows.
+        """
+        for form in self.itervalues():
+            rows = (form.forms if isinstance(form, forms.formsets.BaseFormSet)
+                    else [form])
+            for row in rows:
+                instance = getattr(row, 'instance', None)
+                if isinstance(instance, Model):
+                    yield instance
+
+    def _lock_instances(self, using):
+        """Lock the rows of the existing instances, in a canonical order."""
+        pks = defaultdict(set)
+        for instance in self._iter_instances():
+            if not instance._state.adding and instance.pk is not None:
+                pks[type(instance)].add(instance.pk)
+
+        plan = self.get_save_plan(self.items())
+        for model in plan.order:
+            if not pks[model]:
+                continue
+            db = using or router.db_for_write(model)
+            with self._instrument('lock', _model_label(model)):
+                list(model._base_manager.using(db).select_for_update()
+                     .filter(pk__in=sorted(pks[model]))
+                     .order_by('pk').values_list('pk', flat=True))
+
+    def _save_databases(self, using):
+        """Get the aliases of the databases :py:meth:`save` writes to."""
+        if using is not None:
+            return [using]
+        plan = self.get_save_plan(self.items())
+        return sorted({router.db_for_write(model) for model in plan.order})
+
+    def _iter_save_steps(self, retvals, commit, bulk, batch_size,
+                         changed_only, using, upsert):
+        """Prepare all subforms for saving, yielding the database writes.
+
+        Yields a ``(model, writes)`` pair for each model with rows to
+        delete, then for each model in the save plan, then for each model
+        with links to fill in afterwards. ``writes`` iterates over callables
+        which take no arguments. Later steps need the primary keys set by earlier
+        writes, so each write must be made before asking for the next one.
+
+        The result of saving each subform is stored in ``retvals`` under the
+        subform's name. See :py:meth:`save` for the other arguments.
+
+        """
+        if bulk is None:
+            bulk = self.bulk_save
+        if batch_size is None:
+            batch_size = self.bulk_batch_size
+        if changed_only is None:
+            changed_only = self.save_changed_only
+
+        plan = self.get_save_plan(self.items())
+        if commit:
+            # delete dependents first, so nothing is left pointing at a row
+            # about to go
+            for model in reversed(plan.order):
+                deleted = _deleted_instances(self[plan.formnames[model]])
+                if deleted:
+                    yield model, iter([functools.partial(
+                        delete_instances, model, deleted, using=using)])
 
-            # add to return values
-            formname_retval_map[formname] = original_inst
+        inst_map = {}
+        for model in plan.order:
+            yield model, self._iter_model_writes(
+                plan, model, inst_map, retvals, commit, bulk, batch_size,
+                changed_only, using, upsert)
+
+        # now that every instance exists, fill in the links which had to wait
+        for model, dependency in plan.deferred:
+            yield model, self._iter_link_writes(
+                plan, model, dependency, inst_map, commit, using)
+
+    def _iter_model_writes(self, plan, model, inst_map, retvals, commit,
+                           bulk, batch_size, changed_only, using, upsert):
+        """Prepare the subform for ``model``, yielding its writes."""
+        formname = plan.formnames[model]
+        form = self[formname]
+        try:
+            inst = form.save(commit=False)
+        except ValidationError as e:
+            msg_tmpl = "Couldn't save {name}: {exc} (errors: {errors})"
+            msg = msg_tmpl.format(name=type(form).__name__, exc=e,
+                                  errors=form.errors)
+            raise SubformError(msg).with_traceback(sys.exc_info()[2])
+        inst_map[model] = inst
+
+        # could be working with a form or a formset, so make a single
+        # instance into a singleton list to allow the same code to work in
+        # both cases
+        original_inst = inst
+        is_multiple = plan.kinds[formname] == 'formset'
+        if not is_multiple:
+            inst = [inst]
+
+        # link inst to previously created dependencies
+        relinked = defaultdict(set)  # instance id -> changed link fields
+        for dependency in plan.links[model]:
+            owner = inst_map[dependency.rel.to]
+            for i in inst:
+                old_value = getattr(i, dependency.attname)
+                setattr(i, dependency.name, owner)
+                if getattr(i, dependency.attname) != old_value:
+                    relinked[id(i)].add(dependency.name)
+
+        # save to the database
+        if commit:
+            if upsert and formname in self.natural_keys:
+                new = [i for i in inst if i._state.adding]
+                inst = [i for i in inst if not i._state.adding]
+                yield from iter_upsert_writes(
+                    model, new, self.natural_keys[formname], using,
+                    _written_fields(model, form, plan.links[model]))
+            updates = []
+            if changed_only:
+                inst, updates = _split_changes(model, form, inst, relinked)
+            if bulk and is_multiple:
+                yield from iter_bulk_writes(model, inst,
+                                            model in plan.owners,
+                                            batch_size, using)
+            else:
+                for i in inst:
+                    yield functools.partial(i.save, **_using(using))
+            yield from iter_update_writes(model, updates, batch_size, using)
+            if hasattr(form, 'save_m2m'):  # save other FKs if needed
+                yield form.save_m2m
+
+        # add to return values
+        retvals[formname] = original_inst
+
+    def _iter_link_writes(self, plan, model, dependency, inst_map, commit,
+                          using):
+        """Fill in a deferred link, yielding the writes."""
+        owner = inst_map[dependency.rel.to]
+        inst = inst_map[model]
+        if plan.kinds[plan.formnames[model]] == 'form':
+            inst = [inst]
+        for i in inst:
+            setattr(i, dependency.name, owner)
+            if commit:
+                yield functools.partial(i.save,
+                                        update_fields=[dependency.name],
+                                        **_using(using))
 
-        # decide whether to return one specific value or the dict
+    def _main_form_result(self, retvals, main_form):
+        """Pick the return value of save(); see its ``main_form`` param."""
         if main_form is None:  # parameter unset, so try inst/class variable
             main_form = getattr(self, 'main_form', None)
         if main_form:
-            return formname_retval_map[main_form]
+            return retvals[main_form]
         else:
-            return formname_retval_map
+            return retvals
+
+
+def _call_validators(form, calls):
+    """Call plain validators one after another, e.g. on a worker thread.
+
+    :type  calls: list of (Step, validator) pairs
+    :param calls: The validators, with the steps to time them with.
+
+    :returns:
+        A list of what each validator returned, or the exception it raised.
+
+    """
+    outcomes = []
+    for step, validator in calls:
+        try:
+            with step:
+                outcomes.append(validator(form))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def _threaded_validator(instrument):
+    """Make a function which validates a form on a worker thread.
+
+    ``instrument`` is the CombinedForm's ``_instrument`` method. Database
+    connections opened by worker threads are closed afterwards.
+
+    """
+    caller = threading.get_ident()
+
+    def validate(formname, form):
+        try:
+            with instrument('validate', formname):
+                return form.is_valid()
+        finally:
+            if threading.get_ident() != caller:
+                connections.close_all()
+
+    return validate
+
+
+def _run_coroutine(coroutine):
+    """Run ``coroutine`` to completion on a new event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _deleted_instances(form):
+    """Get the existing instances a model formset has rows marked DELETE.
+
+    These are the instances the formset's ``save()`` would delete.
+
+    """
+    if not isinstance(form, forms.formsets.BaseFormSet):
+        return []
+    deleted_forms = form.deleted_forms
+    return [row.instance for row in form.initial_forms
+            if row in deleted_forms and row.instance.pk is not None]
+
+
+def _allow_taken_keys(form, fields):
+    """Stop model validation rejecting natural keys which are in use.
+
+    Only the checks against the database are skipped: a model formset still
+    rejects two rows with the same natural key.
+
+    """
+    if isinstance(form, forms.formsets.BaseFormSet):
+        form._construct_form = functools.partial(
+            _construct_upsert_form, form._construct_form, fields)
+    elif isinstance(form, forms.BaseForm) and hasattr(form, 'instance'):
+        instance = form.instance
+        for name in ('validate_unique', 'validate_constraints'):
+            validate = getattr(instance, name, None)
+            if validate is not None:
+                setattr(instance, name, functools.partial(
+                    _validate_excluding, validate, fields))
+
+
+def _construct_upsert_form(construct_form, fields, i, **kwargs):
+    """Build a formset row, then make it allow taken natural keys."""
+    form = construct_form(i, **kwargs)
+    _allow_taken_keys(form, fields)
+    return form
+
+
+def _validate_excluding(validate, fields, exclude=None):
+    """Call a model validation method, excluding some more fields."""
+    return validate(exclude=set(exclude or ()) | set(fields))
+
+
+def _split_changes(model, form, instances, relinked):
+    """Sort a subform's instances by how they need to be written.
+
+    :returns:
+        A list of the instances to save in full, i.e. the new ones, and a
+        list of ``(instance, fields)`` pairs for the existing instances which
+        changed, as :py:func:`iter_update_writes` takes. Unchanged instances
+        are left out.
+
+    """
+    if isinstance(form, forms.formsets.BaseFormSet):
+        changed = {id(obj): data for obj, data in form.changed_objects}
+    else:
+        changed = {id(form.instance): form.changed_data}
+    columns = {f.name for f in model._meta.concrete_fields}
+
+    new, updates = [], []
+    for inst in instances:
+        if inst._state.adding or id(inst) not in changed:
+            new.append(inst)
+            continue
+        fields = (columns.intersection(changed[id(inst)]) |
+                  relinked.get(id(inst), set()))
+        if fields:
+            updates.append((inst, fields))
+    return new, updates
+
+
+def _written_fields(model, form, links):
+    """Get the names of the model fields which a subform sets.
+
+    :type  links: list of ForeignKey
+    :param links: The links to other subforms' instances, which are set too.
+
+    :returns: A set of field names, leaving out the primary key.
+
+    """
+    if isinstance(form, forms.formsets.BaseFormSet):
+        names = set().union(*(row.fields for row in form.forms))
+    else:
+        names = set(form.fields)
+    names.update(link.name for link in links)
+    return {f.name for f in model._meta.concrete_fields
+            if f.name in names and not f.primary_key}
+
+
+def _snapshot_instances(instances):
+    """Record the field values and state of model instances.
+
+    :returns: Something to pass to :py:func:`_restore_instances`.
+
+    """
+    return [(inst,
+             {f.attname: getattr(inst, f.attname)
+              for f in inst._meta.concrete_fields},
+             inst._state.adding, inst._state.db)
+            for inst in instances]
+
+
+def _restore_instances(snapshot):
+    """Put instances back as :py:func:`_snapshot_instances` found them."""
+    for inst, values, adding, db in snapshot:
+        for attname, value in values.items():
+            setattr(inst, attname, value)
+        inst._state.adding = adding
+        inst._state.db = db
+
+
+def _using(using):
+    """Get the keyword arguments which make ``Model.save()`` use a database.
+    """
+    return {} if using is None else {'using': using}
+
+
+def _model_label(model):
+    """Get a model's label, e.g. ``'app.Model'``."""
+    return '{}.{}'.format(model._meta.app_label, model._meta.object_name)
+
+
+async def _run_writes_async(writes):
+    """Make the writes from one ``CombinedForm._iter_save_steps`` step."""
+    for write in writes:
+        await _run_write_async(write)
+
+
+async def _run_write_async(write):
+    """Make a write yielded by ``CombinedForm._iter_save_steps``.
+
+    If the write calls a method which has an async counterpart, e.g.
+    ``Model.save()`` and ``Model.asave()``, the counterpart is awaited.
+    Otherwise the write is made on a worker thread; see
+    :py:func:`_run_in_thread`.
+
+    """
+    args, kwargs = (), {}
+    method = write
+    if isinstance(write, functools.partial):
+        method, args, kwargs = write.func, write.args, write.keywords
+
+    owner = getattr(method, '__self__', None)
+    name = getattr(method, '__name__', None)
+    if owner is not None and name is not None:
+        async_method = getattr(owner, 'a' + name, None)
+        if asyncio.iscoroutinefunction(async_method):
+            return await async_method(*args, **kwargs)
+
+    return await _run_in_thread(write)
+
+
+async def _run_in_thread(func):
+    """Call a blocking function from a coroutine, on a worker thread.
+
+    Where asgiref is installed (Django 3.0 and later), this is Django's
+    thread sensitive ``sync_to_async``, so the calls made for a request
+    share one thread and its database connections, as in a sync view.
+    Otherwise ``func`` runs in the event loop's default executor, and the
+    database connections it opens there are closed afterwards, as nothing
+    else would close them.
+
+    """
+    if sync_to_async is not None:
+        return await sync_to_async(func, thread_sensitive=True)()
+    return await _running_loop().run_in_executor(
+        None, functools.partial(_call_and_close, func, threading.get_ident()))
+
+
+def _call_and_close(func, caller):
+    """Call ``func``, then close database connections if on a new thread."""
+    try:
+        return func()
+    finally:
+        if threading.get_ident() != caller:
+            connections.close_all()
+
+
+def _running_loop():
+    """Get the event loop running the current coroutine."""
+    # asyncio.get_running_loop() is new in Python 3.7
+    get_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+    return get_loop()
+
+
+RENDER_STYLES = ('p', 'table', 'ul', 'div')
+
+
+def _freeze(value):
+    """Turn nested dicts and lists into something hashable and ordered."""
+    if isinstance(value, dict):
+        return tuple(sorted(((str(k), _freeze(v)) for k, v in value.items()),
+                            key=lambda item: item[0]))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def render_form(form, style):
+    """Render ``form`` with its ``as_<style>()`` method.
+
+    Forms from Django versions without ``as_div()`` get an equivalent
+    rendering.
+
+    """
+    render = getattr(form, 'as_' + style, None)
+    if render is None and style == 'div':
+        return form._html_output(
+            normal_row=('<div%(html_class_attr)s>%(label)s %(field)s'
+                        '%(help_text)s</div>'),
+            error_row='%s',
+            row_ender='</div>',
+            help_text_html=' <span class="helptext">%s</span>',
+            errors_on_separate_row=True)
+    return render()
 
 
 def get_model_dependencies(model, relevant_models=None):
@@ -552,68 +2455,381 @@ def get_model_dependencies(model, relevant_models=None):
             and f.rel.to in (relevant_models or [f.rel.to]))
 
 
-def order_by_dependency(models):
-    """Get a dependency sequence for the given models.
+def save_instances_in_bulk(model, instances, needs_pk=False,
+                           batch_size=None, using=None):
+    """Save model instances, inserting the new ones with ``bulk_create``.
+
+    Instances which already exist in the database are saved individually.
+    New instances are inserted in one ``bulk_create`` call, unless their
+    primary keys are needed afterwards and the database can't return them
+    from a bulk insert; then they're saved individually too.
+
+    :type  needs_pk: bool
+    :param needs_pk:
+        Whether the caller needs the primary keys of the new instances, for
+        example to link other instances to them. They're always needed if
+        ``model`` has many-to-many fields.
+
+    :type  batch_size: int
+    :param batch_size: Passed on to ``bulk_create``.
+
+    :type  using: str
+    :param using: The database to write to. ``None`` asks the routers.
+
+    """
+    for write in iter_bulk_writes(model, instances, needs_pk, batch_size,
+                                  using):
+        write()
+
+
+def iter_bulk_writes(model, instances, needs_pk=False, batch_size=None,
+                     using=None):
+    """Yield the writes made by :py:func:`save_instances_in_bulk`.
+
+    Each write is a ``functools.partial`` of a model or manager method.
+
+    """
+    new, existing = [], []
+    for inst in instances:
+        (new if inst.pk is None else existing).append(inst)
+
+    if new:
+        db = using or router.db_for_write(model)
+        needs_pk = needs_pk or bool(model._meta.many_to_many)
+        features = connections[db].features
+        can_bulk = (not model._meta.parents and
+                    (not needs_pk or getattr(
+                        features, 'can_return_ids_from_bulk_insert', False)))
+        if can_bulk:
+            manager = model._default_manager.db_manager(db)
+            yield functools.partial(manager.bulk_create, new,
+                                    batch_size=batch_size)
+        else:
+            existing.extend(new)
+
+    for inst in existing:
+        yield functools.partial(inst.save, **_using(using))
+
+
+def delete_instances(model, instances, using=None):
+    """Delete model instances together, rather than one at a time.
+
+    When nothing listens to ``model``'s delete signals and no other model
+    cascades from it, the instances are deleted with a single ``DELETE``
+    statement. Otherwise they're deleted the way ``Model.delete()`` would
+    delete them, sending the signals for each instance, but with one
+    collection of cascades and batched ``DELETE`` statements for all of them.
+
+    Like ``Model.delete()``, this sets the instances' primary keys to
+    ``None``.
+
+    :type  using: str
+    :param using: The database to delete from. ``None`` asks the routers.
+
+    """
+    if not instances:
+        return
+    db = using or router.db_for_write(model, instance=instances[0])
+    collector = Collector(using=db)
+    queryset = model._base_manager.using(db).filter(
+        pk__in=[inst.pk for inst in instances])
+    if collector.can_fast_delete(queryset):
+        queryset.delete()
+        for inst in instances:
+            setattr(inst, model._meta.pk.attname, None)
+    else:
+        collector.collect(instances)
+        collector.delete()
+
+
+def iter_upsert_writes(model, instances, natural_key, using=None,
+                       update_fields=None):
+    """Yield writes which insert new instances or update matching rows.
+
+    A row matches an instance if it has the same values in the
+    ``natural_key`` fields, which should have a unique constraint. The
+    primary keys of the matching rows are fetched first, so saving an
+    instance which matches a row updates that row, and the others are
+    inserted. After the writes, every instance has the primary key of its
+    row.
+
+    This isn't safe from races by itself: another save can insert a
+    matching row after the primary keys are fetched. Each insert is made
+    in a savepoint, and if it fails with ``IntegrityError``, the matching
+    row is looked up again and updated instead; see
+    :py:func:`save_upsert_instance`.
+
+    :type  natural_key: seq of str
+    :param natural_key: The names of the fields which identify a row.
+
+    :type  using: str
+    :param using: The database to write to. ``None`` asks the routers.
+
+    :type  update_fields: seq of str
+    :param update_fields:
+        The fields to write to a matching row, e.g. those a form sets.
+        Other columns keep the values they have in the database. ``None``
+        writes every field.
+
+    """
+    if not instances:
+        return
+    yield functools.partial(fetch_natural_key_pks, model, instances,
+                            natural_key, using)
+    for inst in instances:
+        yield functools.partial(save_upsert_instance, inst, natural_key,
+                                using, update_fields)
+
+
+def save_upsert_instance(inst, natural_key, using=None, update_fields=None):
+    """Save an instance prepared by :py:func:`fetch_natural_key_pks`.
+
+    An instance which matched a row updates its ``update_fields``. Other
+    instances are inserted, in a savepoint. If the insert fails with
+    ``IntegrityError`` because a matching row has been inserted since, that
+    row is updated instead; if it fails for any other reason, the error is
+    raised.
+
+    """
+    model = type(inst)
+    db = using or router.db_for_write(model, instance=inst)
+    if not inst._state.adding:
+        inst.save(using=db, update_fields=update_fields)
+        return
+    try:
+        with transaction.atomic(using=db):
+            inst.save(using=db)
+    except IntegrityError:
+        fetch_natural_key_pks(model, [inst], natural_key, db)
+        if inst._state.adding:  # not a clash on the natural key
+            raise
+        inst.save(using=db, update_fields=update_fields)
+
+
+def fetch_natural_key_pks(model, instances, natural_key, using=None):
+    """Give new instances the primary keys of rows they match.
+
+    A row matches an instance if it has the same values in the
+    ``natural_key`` fields. Instances which match a row are marked as
+    saved, so saving them updates it.
+
+    """
+    fields = [model._meta.get_field(name) for name in natural_key]
+    attnames = [f.attname for f in fields]
+    pending = defaultdict(list)
+    for inst in instances:
+        if inst._state.adding:
+            pending[tuple(getattr(inst, a) for a in attnames)].append(inst)
+    if not pending:
+        return
+
+    db = using or router.db_for_write(model)
+    first_values = sorted({key[0] for key in pending}, key=repr)
+    batch_size = (connections[db].ops.bulk_batch_size(fields[:1],
+                                                      first_values) or
+                  len(first_values))
+    queryset = model._base_manager.using(db)
+    for start in range(0, len(first_values), batch_size):
+        rows = queryset.filter(**{
+            attnames[0] + '__in': first_values[start:start + batch_size],
+        }).values_list('pk', *attnames)
+        for row in rows:
+            for inst in pending.get(tuple(row[1:]), ()):
+                inst.pk = row[0]
+                inst._state.adding = False
+                inst._state.db = db
+
+
+def iter_update_writes(model, updates, batch_size=None, using=None):
+    """Yield writes which save only the given fields of existing instances.
+
+    :type  updates: list of (instance, field names) pairs
+    :param updates: The instances to write, with the fields to write on each.
+
+    All instances are written in one ``bulk_update`` call, with the union of
+    their fields, where Django provides it (2.2 and later). Otherwise each
+    instance is saved with its own ``update_fields``.
+
+    :type  using: str
+    :param using: The database to write to. ``None`` asks the routers.
+
+    """
+    if not updates:
+        return
+    manager = model._default_manager.db_manager(
+        using or router.db_for_write(model))
+    if hasattr(manager, 'bulk_update'):
+        fields = sorted(set().union(*(fields for _, fields in updates)))
+        yield functools.partial(manager.bulk_update,
+                                [inst for inst, _ in updates], fields,
+                                batch_size=batch_size)
+    else:
+        for inst, fields in updates:
+            yield functools.partial(inst.save, update_fields=sorted(fields),
+                                    **_using(using))
+
+
+def resolve_dependencies(models):
+    """Work out a save order for ``models`` and the links which must wait.
+
+    A model is saved after every model it has a ForeignKey to. Two kinds of
+    ForeignKey can't be satisfied that way, so they are *deferred*: the
+    instance is saved without the link, and the link is filled in afterwards
+    by an UPDATE.
+
+    - ForeignKeys from a model to itself.
+    - Nullable ForeignKeys which are part of a cycle, e.g. a nullable
+      back-reference from a parent to one of its children.
+
+    This runs in time linear to the number of models and ForeignKeys.
 
     :arg  models: The models to relate.
     :type models: seq
 
-    :returns: A list in order from leaves (no depndencies) to root.
+    :raises DependencyCycleError:
+        If some models depend on each other only through non-nullable
+        ForeignKeys.
+
+    :rtype: :py:class:`DependencyPlan`
 
     """
-    class Node(object):
+    models = list(OrderedDict.fromkeys(models))  # drop duplicates, keep order
+    position = {model: i for i, model in enumerate(models)}
+
+    edges = []  # (dependency, dependent, field) triples
+    deferred = []
+    for model in models:
+        for fkfield in get_model_dependencies(model, position):
+            if fkfield.rel.to is model:
+                deferred.append((model, fkfield))
+            else:
+                edges.append((fkfield.rel.to, model, fkfield))
+
+    ordered, leftover = _topological_sort(models, edges)
+
+    if leftover:
+        # the leftover models include at least one cycle; try to break every
+        # cycle by deferring its nullable links, then sort again
+        cycles = [c for c in _strongly_connected(leftover, edges)
+                  if len(c) > 1]
+        in_cycle = {model: i for i, cycle in enumerate(cycles)
+                    for model in cycle}
+        kept_edges = []
+        for edge in edges:
+            dependency, dependent, fkfield = edge
+            same_cycle = (dependency in in_cycle and
+                          in_cycle.get(dependent) == in_cycle[dependency])
+            if same_cycle and fkfield.null:
+                deferred.append((dependent, fkfield))
+            else:
+                kept_edges.append(edge)
+        edges = kept_edges
 
-        def __init__(self, model):
-            self.model = model
-            self.dependents = []
+        ordered, leftover = _topological_sort(models, edges)
+        if leftover:
+            stuck = [m for c in _strongly_connected(leftover, edges)
+                     if len(c) > 1 for m in c]
+            raise DependencyCycleError(sorted(stuck, key=position.get))
 
-        def add_dependent(self, dep):
-            self.dependents.append(dep)
+    # models with the longest chain of dependents go first, which keeps the
+    # order stable and close to the declared one
+    dependents = defaultdict(list)
+    for dependency, dependent, _ in edges:
+        dependents[dependency].append(dependent)
+    height = {}
+    for model in reversed(ordered):
+        height[model] = 1 + max((height[d] for d in dependents[model]),
+                                default=-1)
+    order = sorted(ordered, key=lambda m: (-height[m], position[m]))
 
-        @property
-        def depth(self):
-            """Recursively calculate the depth of this node."""
-            if self.dependents:
-                return 1 + max(d.depth for d in self.dependents)
-            else:
-                return 0
+    return DependencyPlan(tuple(order), tuple(deferred))
 
-        def __unicode__(self):
-            mname = self.model.__name__
-            dstr = ", ".join(d.model.__name__ for d in self.dependents)
 
-            if not dstr:
-                dstr = '[]'
+def _topological_sort(models, edges):
+    """Sort ``models`` so every dependency comes before its dependents.
 
-            return "Node(model={}, dependents={})".format(mname, dstr)
+    Uses Kahn's algorithm.
+
+    :returns:
+        A ``(ordered, leftover)`` pair. ``leftover`` holds the models which
+        could not be ordered because they are in, or depend on, a cycle.
+
+    """
+    dependents = defaultdict(list)
+    indegree = dict.fromkeys(models, 0)
+    for dependency, dependent, _ in edges:
+        dependents[dependency].append(dependent)
+        indegree[dependent] += 1
 
-        def __str__(self):
-            return str(self.__unicode__())
+    ready = deque(m for m in models if not indegree[m])
+    ordered = []
+    while ready:
+        model = ready.popleft()
+        ordered.append(model)
+        for dependent in dependents[model]:
+            indegree[dependent] -= 1
+            if not indegree[dependent]:
+                ready.append(dependent)
 
-        def __repr__(self):
-            return str(self)
+    return ordered, [m for m in models if indegree[m]]
 
-    def foreign_keys(m):
-        """Get all ForeignKey fields on the given model `m`"""
-        return (f for f in m._meta.fields if isinstance(f, ForeignKey))
 
-    nodemap = {}
+def _strongly_connected(models, edges):
+    """Group ``models`` into strongly connected components.
 
-    def get_nodemap(key):
-        """Get value at key, or if it doesn't exist create an empty Node."""
-        val = nodemap.get(key, Node(key))
-        nodemap[key] = val
-        return val
+    Only edges between two of the given models are considered. Uses
+    Tarjan's algorithm.
+
+    :rtype: list of lists of models
+
+    """
+    models = set(models)
+    dependents = defaultdict(list)
+    for dependency, dependent, _ in edges:
+        if dependency in models and dependent in models:
+            dependents[dependency].append(dependent)
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(model):
+        index[model] = lowlink[model] = len(index)
+        stack.append(model)
+        on_stack.add(model)
+        for dependent in dependents[model]:
+            if dependent not in index:
+                visit(dependent)
+                lowlink[model] = min(lowlink[model], lowlink[dependent])
+            elif dependent in on_stack:
+                lowlink[model] = min(lowlink[model], index[dependent])
+        if lowlink[model] == index[model]:
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                component.append(member)
+                if member is model:
+                    break
+            components.append(component)
 
     for model in models:
-        self = get_nodemap(model)
+        if model not in index:
+            visit(model)
+    return components
+
+
+def order_by_dependency(models):
+    """Get a dependency sequence for the given models.
 
-        for fkfield in get_model_dependencies(model, models):
-            fkmodel = fkfield.rel.to
-            dependency = get_nodemap(fkmodel)
-            dependency.add_dependent(self)
+    See :py:func:`resolve_dependencies` for how cycles are handled.
 
-    # sort by reverse depth to get the models with no dependencies first
-    sortedmodels = sorted(((n.depth, n.model) for n in nodemap.values()),
-                          key=lambda tup: tup[0],  reverse=True)
-    return [model for weight, model in sortedmodels]
+    :arg  models: The models to relate.
+    :type models: seq
+
+    :returns: A list in order from leaves (no depndencies) to root.
+
+    """
+    return list(resolve_dependencies(models).order)
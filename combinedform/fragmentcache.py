@@ -0,0 +1,112 @@
+"""Caches for the rendered HTML of unbound subforms.
+
+Set a cache as the ``fragment_cache`` option of a
+:py:class:`combinedform.CombinedForm` to use it. Fragments are stored by
+namespace (one per CombinedForm class) and key (see
+:py:meth:`CombinedForm.fragment_key`).
+
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+
+from django.core.cache import caches
+
+
+class LRUFragmentCache(object):
+    """An in-process cache which evicts the least recently used fragments."""
+
+    def __init__(self, max_entries=1000):
+        """Create an empty cache holding at most ``max_entries`` fragments."""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        """Get a fragment, or ``None`` if it isn't cached."""
+        with self._lock:
+            try:
+                self._entries.move_to_end((namespace, key))
+            except KeyError:
+                return None
+            return self._entries[(namespace, key)]
+
+    def set(self, namespace, key, fragment):
+        """Store a fragment, evicting the oldest one if the cache is full."""
+        with self._lock:
+            self._entries[(namespace, key)] = fragment
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace=None):
+        """Drop all fragments in ``namespace``, or all fragments at all."""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                for entry in [e for e in self._entries if e[0] == namespace]:
+                    del self._entries[entry]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoFragmentCache(object):
+    """A cache which stores fragments in one of Django's cache backends.
+
+    Django caches can't delete keys by pattern, so each namespace has a
+    version number which is part of its keys. Invalidating a namespace bumps
+    its version; the old fragments are left for the backend to expire.
+
+    """
+
+    def __init__(self, alias='default', timeout=None, key_prefix='cfrag'):
+        """Use the cache named ``alias`` in the ``CACHES`` setting.
+
+        :type  timeout: int
+        :param timeout: Seconds to keep fragments; ``None`` uses the cache's
+                        default timeout.
+
+        """
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, namespace, key):
+        """Get a fragment, or ``None`` if it isn't cached."""
+        return self.cache.get(self._cache_key(namespace, key))
+
+    def set(self, namespace, key, fragment):
+        """Store a fragment."""
+        kwargs = {} if self.timeout is None else {'timeout': self.timeout}
+        self.cache.set(self._cache_key(namespace, key), fragment, **kwargs)
+
+    def invalidate(self, namespace=None):
+        """Drop all fragments in ``namespace``, or all fragments at all."""
+        version_key = self._version_key(namespace)
+        try:
+            self.cache.incr(version_key)
+        except ValueError:  # no version stored yet
+            self.cache.set(version_key, 1, timeout=None)
+
+    def _version_key(self, namespace):
+        name = '*' if namespace is None else _hash(namespace)
+        return '{}:version:{}'.format(self.key_prefix, name)
+
+    def _cache_key(self, namespace, key):
+        global_key = self._version_key(None)
+        namespace_key = self._version_key(namespace)
+        versions = self.cache.get_many([global_key, namespace_key])
+        return '{}:{}:{}:{}:{}'.format(
+            self.key_prefix, _hash(namespace), versions.get(global_key, 0),
+            versions.get(namespace_key, 0), _hash(repr(key)))
+
+
+def _hash(text):
+    """Shorten ``text`` into something safe to use in any cache key."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
@@ -0,0 +1,205 @@
+"""Timing hooks for the steps a CombinedForm goes through.
+
+A hook is a callable taking an :py:class:`InstrumentEvent`. Hooks can be
+installed for all CombinedForms with :py:func:`add_hook`, or for one class
+with its ``instruments`` option. The phases are:
+
+``'init'``
+    Building a subform; the name is the subform's.
+
+``'validate'``
+    A subform's ``is_valid()``; the name is the subform's.
+
+``'validator'``
+    Running one of the ``validators``; the name is the validator's.
+
+``'save'``
+    Saving all instances of one model; the name is the model's label.
+
+``'lock'``
+    Locking the rows of one model before saving; the name is the model's
+    label.
+
+When no hooks are installed, nothing is timed.
+
+"""
+from collections import defaultdict, deque, namedtuple
+import threading
+import time
+
+
+InstrumentEvent = namedtuple('InstrumentEvent', [
+    'form_class',  # the CombinedForm subclass
+    'phase',
+    'name',
+    'duration',  # wall time in seconds
+    'exception',  # what the step raised, or None
+])
+
+
+# hooks for all CombinedForms
+hooks = []
+
+_local = threading.local()
+
+
+def add_hook(hook):
+    """Call ``hook`` with an event after every step of every CombinedForm."""
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Stop calling a hook installed with :py:func:`add_hook`."""
+    hooks.remove(hook)
+
+
+def current_step():
+    """Get the innermost step running on this thread, or ``None``.
+
+    :rtype: Step
+
+    """
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+class Step(object):
+    """Time a step, as a context manager, and report it to the hooks."""
+
+    def __init__(self, form_class, phase, name, instruments=()):
+        self.form_class = form_class
+        self.phase = phase
+        self.name = name
+        self.instruments = instruments
+        self._start = None
+
+    def __enter__(self):
+        try:
+            _local.stack.append(self)
+        except AttributeError:
+            _local.stack = [self]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _local.stack.pop()
+        self.report(duration, exc)
+        return False
+
+    async def run(self, coroutine):
+        """Await ``coroutine``, timing it as this step.
+
+        Coroutines running at the same time interleave on one thread, so
+        this step isn't made the :py:func:`current_step`.
+
+        """
+        start = time.perf_counter()
+        try:
+            result = await coroutine
+        except BaseException as exc:
+            self.report(time.perf_counter() - start, exc)
+            raise
+        self.report(time.perf_counter() - start, None)
+        return result
+
+    def report(self, duration, exception=None):
+        """Send an event for this step to all hooks."""
+        event = InstrumentEvent(self.form_class, self.phase, self.name,
+                                duration, exception)
+        for hook in hooks:
+            hook(event)
+        for hook in self.instruments:
+            hook(event)
+
+
+class _NullStep(object):
+    """Stand in for a Step when there are no hooks to report to."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def run(self, coroutine):
+        return await coroutine
+
+
+NULL_STEP = _NullStep()
+
+
+class TimingAggregator(object):
+    """A hook which keeps timing percentiles per CombinedForm and phase.
+
+    Only the latest ``sample_size`` durations of each class and phase are
+    kept, so memory use is bounded however long the process runs.
+
+    Example:
+
+    ::
+
+        timings = TimingAggregator()
+        combinedform.instrumentation.add_hook(timings)
+        ...
+        timings.summary()
+
+    """
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self._samples = defaultdict(lambda: deque(maxlen=self.sample_size))
+        self._counts = defaultdict(lambda: [0, 0])  # steps and errors
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        key = (event.form_class, event.phase)
+        with self._lock:
+            self._samples[key].append(event.duration)
+            counts = self._counts[key]
+            counts[0] += 1
+            if event.exception is not None:
+                counts[1] += 1
+
+    def percentile(self, form_class, phase, percent):
+        """Get a percentile of the recent durations, or ``None``."""
+        with self._lock:
+            samples = sorted(self._samples.get((form_class, phase), ()))
+        return _nearest_rank(samples, percent)
+
+    def summary(self, percents=(50, 90, 99)):
+        """Summarize the timings of every CombinedForm class and phase.
+
+        :returns:
+            A dict from ``(form_class, phase)`` to a dict with the number of
+            steps (``'count'``), how many raised (``'errors'``), the longest
+            recent duration (``'max'``) and each percentile (e.g. ``'p50'``).
+
+        """
+        with self._lock:
+            samples = {key: sorted(durations)
+                       for key, durations in self._samples.items()}
+            counts = dict(self._counts)
+        summary = {}
+        for key, durations in samples.items():
+            stats = {'count': counts[key][0], 'errors': counts[key][1],
+                     'max': durations[-1]}
+            for percent in percents:
+                stats['p{}'.format(percent)] = _nearest_rank(durations,
+                                                             percent)
+            summary[key] = stats
+        return summary
+
+    def reset(self):
+        """Forget all timings."""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+def _nearest_rank(samples, percent):
+    """Get a percentile of sorted ``samples`` by the nearest-rank method."""
+    if not samples:
+        return None
+    rank = max(1, -(-len(samples) * percent // 100))  # ceiling division
+    return samples[int(rank) - 1]
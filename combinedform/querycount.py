@@ -0,0 +1,186 @@
+"""Count the SQL queries CombinedForms make, by subform and phase.
+
+Example:
+
+::
+
+    with QueryCounter() as queries:
+        if form.is_valid():
+            form.save()
+    logger.info(queries.summary())
+    assert queries.count(phase='save') <= 3
+
+Each query is tagged with the :py:mod:`combinedform.instrumentation` step
+running when it was made, i.e. the CombinedForm class, the phase and the
+subform, validator or model name. Only queries made on the current thread
+are counted, so subforms validated by a ``validation_executor`` aren't.
+
+"""
+from collections import Counter, defaultdict, namedtuple
+import functools
+import time
+
+from django.db import connections
+
+from . import instrumentation
+
+
+QueryStats = namedtuple('QueryStats', [
+    'form_class',  # None for queries made outside any CombinedForm step
+    'phase',
+    'name',
+    'count',
+    'time',  # total seconds
+    'duplicates',  # {sql: count} of statements repeated with the same params
+    'similar',  # {sql: count} of statements repeated with any params
+])
+
+
+class QueryCounter(object):
+    """A context manager which counts queries while it's active.
+
+    :type  using: seq of str
+    :param using: The database aliases to watch. ``None`` watches all.
+
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+        self._queries = defaultdict(list)  # step key -> [(sql, params, time)]
+        self._restore = []
+
+    def __call__(self, event):
+        """Do nothing with events; being a hook makes steps get tracked."""
+
+    def __enter__(self):
+        instrumentation.add_hook(self)
+        aliases = connections if self.using is None else self.using
+        for alias in aliases:
+            self._watch(connections[alias])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        instrumentation.remove_hook(self)
+        while self._restore:
+            self._restore.pop()()
+        return False
+
+    def _watch(self, connection):
+        """Start counting the queries made on ``connection``."""
+        if hasattr(connection, 'execute_wrapper'):  # Django 2.0 and later
+            wrapper = connection.execute_wrapper(self._execute)
+            wrapper.__enter__()
+            self._restore.append(lambda: wrapper.__exit__(None, None, None))
+            return
+
+        # older versions can only be hooked into where cursors are made
+        for attr in ('make_cursor', 'make_debug_cursor'):
+            self._restore.append(functools.partial(
+                _unwrap, connection, attr, connection.__dict__.get(attr)))
+            setattr(connection, attr, functools.partial(
+                _make_counting_cursor, getattr(connection, attr),
+                self._execute))
+
+    def _execute(self, execute, sql, params, many, context):
+        """Make and record a query; see ``connection.execute_wrapper()``."""
+        step = instrumentation.current_step()
+        key = ((step.form_class, step.phase, step.name) if step is not None
+               else (None, None, None))
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self._queries[key].append((sql, repr(params),
+                                       time.perf_counter() - start))
+
+    def report(self):
+        """Get the statistics of each step which made queries.
+
+        :rtype: list of QueryStats
+
+        """
+        report = []
+        for (form_class, phase, name), queries in self._queries.items():
+            statements = Counter(sql for sql, _, _ in queries)
+            executions = Counter((sql, params) for sql, params, _ in queries)
+            duplicates = Counter()
+            for (sql, _), count in executions.items():
+                if count > 1:
+                    duplicates[sql] += count
+            report.append(QueryStats(
+                form_class, phase, name, len(queries),
+                sum(duration for _, _, duration in queries),
+                dict(duplicates),
+                {sql: count for sql, count in statements.items()
+                 if count > 1}))
+        return report
+
+    def count(self, form_class=None, phase=None, name=None):
+        """Count the queries, optionally only those of some steps."""
+        return sum(stats.count for stats in self.report()
+                   if (form_class is None or stats.form_class is form_class)
+                   and (phase is None or stats.phase == phase)
+                   and (name is None or stats.name == name))
+
+    def summary(self):
+        """Describe the report in a few lines of text, e.g. for a log."""
+        lines = []
+        for stats in self.report():
+            if stats.form_class is None:
+                step = 'outside CombinedForms'
+            else:
+                step = '{} {} {}'.format(stats.form_class.__name__,
+                                         stats.phase, stats.name)
+            line = '{}: {} queries in {:.1f}ms'.format(step, stats.count,
+                                                      stats.time * 1000)
+            if stats.similar:
+                line += ', {} repeated statements'.format(
+                    sum(stats.similar.values()))
+            if stats.duplicates:
+                line += ' ({} exact duplicates)'.format(
+                    sum(stats.duplicates.values()))
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+class _CountingCursor(object):
+    """Wrap a cursor to send its queries through an execute wrapper."""
+
+    def __init__(self, cursor, wrapper):
+        self.cursor = cursor
+        self.wrapper = wrapper
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self.cursor.__exit__(exc_type, exc, tb)
+
+    def _execute(self, sql, params, many, context):
+        if many:
+            return self.cursor.executemany(sql, params)
+        return self.cursor.execute(sql, params)
+
+    def execute(self, sql, params=None):
+        return self.wrapper(self._execute, sql, params, False, {})
+
+    def executemany(self, sql, param_list):
+        return self.wrapper(self._execute, sql, param_list, True, {})
+
+
+def _make_counting_cursor(make_cursor, wrapper, cursor):
+    return _CountingCursor(make_cursor(cursor), wrapper)
+
+
+def _unwrap(connection, attr, previous):
+    """Undo the cursor wrapping done by ``QueryCounter._watch``."""
+    if previous is None:
+        delattr(connection, attr)
+    else:
+        setattr(connection, attr, previous)
@@ -0,0 +1,261 @@
+"""Benchmarks for CombinedForm construction, validation, rendering and saving.
+
+Run them with ``python manage.py benchmark``. Each benchmark is run on
+generated forms, varying one of:
+
+- the number of subforms, and the number of fields in each
+- the number of rows in a model formset subform
+- the length of a chain of ForeignKeys between model form subforms
+
+The models are made up on the fly, and their tables are created in the
+default database if they're missing. The command runs the benchmarks in a
+throwaway test database.
+
+"""
+import gc
+import statistics
+import time
+
+import django
+import django.db.models
+import django.forms
+from django.db import connection, transaction
+
+import combinedform
+
+
+SUBFORM_COUNTS = (1, 5, 20, 50)
+FIELD_COUNTS = (1, 10, 30)
+ROW_COUNTS = (1, 100, 1000, 5000)
+FK_DEPTHS = (1, 3, 6)
+
+QUICK_SUBFORM_COUNTS = (1, 5)
+QUICK_FIELD_COUNTS = (1, 10)
+QUICK_ROW_COUNTS = (1, 100)
+QUICK_FK_DEPTHS = (1, 3)
+
+
+def run_benchmarks(quick=False, repeat=5, only=None):
+    """Run the benchmarks.
+
+    :type  quick: bool
+    :param quick: Only try the smaller sizes.
+
+    :type  repeat: int
+    :param repeat: How many times to time each benchmark.
+
+    :type  only: str
+    :param only: Only run benchmarks whose names contain this.
+
+    :returns: A dict in the format of :py:func:`compare`'s arguments.
+
+    """
+    results = {}
+    for name, setup, func in _iter_benchmarks(quick):
+        if only is None or only in name:
+            results[name] = measure(setup, func, repeat)
+
+    return {
+        'environment': {
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'quick': quick,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def measure(setup, func, repeat):
+    """Time ``func(setup())`` ``repeat`` times, not counting ``setup()``.
+
+    :returns: A dict of the ``'min'`` and ``'median'`` times in seconds.
+
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Find the benchmarks which got slower than in ``baseline``.
+
+    ``results`` and ``baseline`` are dicts returned by
+    :py:func:`run_benchmarks`. Benchmarks only in one of them are ignored.
+
+    :type  tolerance: float
+    :param tolerance: How much slower a median time may get, as a fraction.
+
+    :returns: A list of ``(name, baseline median, new median)`` tuples.
+
+    """
+    regressions = []
+    old_results = baseline['results']
+    for name, timing in sorted(results['results'].items()):
+        if name not in old_results:
+            continue
+        old_median = old_results[name]['median']
+        if timing['median'] > old_median * (1 + tolerance):
+            regressions.append((name, old_median, timing['median']))
+    return regressions
+
+
+def _iter_benchmarks(quick):
+    """Yield a ``(name, setup, func)`` triple for each benchmark."""
+    subform_counts = QUICK_SUBFORM_COUNTS if quick else SUBFORM_COUNTS
+    field_counts = QUICK_FIELD_COUNTS if quick else FIELD_COUNTS
+    for subforms in subform_counts:
+        for fields in field_counts:
+            yield from _form_benchmarks(subforms, fields)
+
+    for rows in QUICK_ROW_COUNTS if quick else ROW_COUNTS:
+        yield from _formset_benchmarks(rows)
+
+    for depth in QUICK_FK_DEPTHS if quick else FK_DEPTHS:
+        yield from _chain_benchmarks(depth)
+
+
+def _form_benchmarks(subforms, fields):
+    """Benchmark plain forms: build, validate, render and report errors."""
+    form_class = make_combined_form(subforms, fields)
+    data = {}
+    for i in range(subforms):
+        for j in range(fields):
+            data['s{}-f{}'.format(i, j)] = 'value'
+    tag = 'subforms={},fields={}'.format(subforms, fields)
+
+    yield ('construct[{}]'.format(tag), lambda: data, form_class)
+    yield ('is_valid[{}]'.format(tag), lambda: form_class(data),
+           lambda form: form.is_valid())
+    yield ('as_p[{}]'.format(tag), form_class, lambda form: form.as_p())
+    yield ('errors[{}]'.format(tag), lambda: form_class({}),
+           lambda form: form.errors)
+
+
+def _formset_benchmarks(rows):
+    """Benchmark a model formset subform: validate and save."""
+    form_class = make_formset_form(rows)
+    data = {'name': 'order', 'rows-TOTAL_FORMS': rows,
+            'rows-INITIAL_FORMS': 0}
+    for i in range(rows):
+        data['rows-{}-title'.format(i)] = 'row {}'.format(i)
+    tag = 'rows={}'.format(rows)
+
+    def bound():
+        form = form_class(data)
+        form.is_valid()
+        return form
+
+    yield ('is_valid[{}]'.format(tag), lambda: form_class(data),
+           lambda form: form.is_valid())
+    yield ('save[{}]'.format(tag), bound, _save_and_roll_back)
+    yield ('save_bulk[{}]'.format(tag), bound,
+           lambda form: _save_and_roll_back(form, bulk=True))
+
+
+def _chain_benchmarks(depth):
+    """Benchmark model forms linked by a chain of ForeignKeys."""
+    form_class = make_chain_form(depth)
+    data = {'m{}-name'.format(i): 'name' for i in range(depth)}
+    tag = 'fk_depth={}'.format(depth)
+
+    def bound():
+        form = form_class(data)
+        form.is_valid()
+        return form
+
+    yield ('is_valid[{}]'.format(tag), lambda: form_class(data),
+           lambda form: form.is_valid())
+    yield ('save[{}]'.format(tag), bound, _save_and_roll_back)
+
+
+def _save_and_roll_back(form, **kwargs):
+    """Save a CombinedForm, then undo it so each run starts the same."""
+    with transaction.atomic():
+        form.save(**kwargs)
+        transaction.set_rollback(True)
+
+
+def make_combined_form(subforms, fields):
+    """Make a CombinedForm of ``subforms`` forms with ``fields`` fields."""
+    form_class = type('BenchForm', (django.forms.Form,), {
+        'f{}'.format(j): django.forms.CharField(max_length=20)
+        for j in range(fields)})
+    attrs = {'s{}'.format(i): combinedform.Subform(form_class,
+                                                   prefix='s{}'.format(i))
+             for i in range(subforms)}
+    return type('BenchCombinedForm', (combinedform.CombinedForm,), attrs)
+
+
+def make_formset_form(rows):
+    """Make a CombinedForm with a model form and a formset of its rows."""
+    order, line = _order_models()
+    order_form = django.forms.models.modelform_factory(order,
+                                                      fields=('name',))
+    line_formset = django.forms.models.inlineformset_factory(
+        order, line, fields=('title',), can_delete=False, extra=0,
+        max_num=rows)
+    return type('BenchFormsetForm', (combinedform.CombinedForm,), {
+        'order': combinedform.Subform(order_form),
+        'rows': combinedform.Subform(line_formset, prefix='rows'),
+    })
+
+
+def make_chain_form(depth):
+    """Make a CombinedForm of a chain of ``depth`` linked model forms."""
+    attrs = {}
+    for i, model in enumerate(_chain_models(depth)):
+        model_form = django.forms.models.modelform_factory(model,
+                                                          fields=('name',))
+        attrs['m{}'.format(i)] = combinedform.Subform(model_form,
+                                                      prefix='m{}'.format(i))
+    return type('BenchChainForm', (combinedform.CombinedForm,), attrs)
+
+
+_made_models = {}
+
+
+def _order_models():
+    """Get the order and line models, making any missing ones."""
+    order = _model('BenchOrder',
+                   name=django.db.models.CharField(max_length=20))
+    line = _model('BenchLine',
+                  title=django.db.models.CharField(max_length=20),
+                  order=django.db.models.ForeignKey(order))
+    return order, line
+
+
+def _chain_models(depth):
+    """Get a chain of ``depth`` models, making any missing ones."""
+    models = []
+    for i in range(depth):
+        fields = {'name': django.db.models.CharField(max_length=20)}
+        if i:
+            fields['parent'] = django.db.models.ForeignKey(models[-1])
+        models.append(_model('BenchLink{}'.format(i), **fields))
+    return models
+
+
+def _model(model_name, **fields):
+    """Get a model declared in this app, with a table in the database.
+
+    Models can't be declared twice, so each is made the first time it's
+    asked for, with the given fields.
+
+    """
+    try:
+        model = _made_models[model_name]
+    except KeyError:
+        fields['__module__'] = __name__
+        fields['Meta'] = type('Meta', (), {'app_label': 'testapp'})
+        model = _made_models[model_name] = type(
+            model_name, (django.db.models.Model,), fields)
+    if model._meta.db_table not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+    return model
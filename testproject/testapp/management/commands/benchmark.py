@@ -0,0 +1,65 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from testapp import benchmarks
+
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'benchmark_baseline.json')
+
+
+class Command(BaseCommand):
+    help = ("Benchmark CombinedForm in a throwaway test database, and "
+            "compare the results against a baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quick', action='store_true',
+                            help="Only try the smaller sizes.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="How many times to time each benchmark.")
+        parser.add_argument('--only',
+                            help="Only run benchmarks whose names contain "
+                                 "this.")
+        parser.add_argument('--output',
+                            help="Write the results to this JSON file "
+                                 "instead of standard output.")
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help="Compare against the results in this JSON "
+                                 "file, if it exists. Defaults to "
+                                 "benchmark_baseline.json next to "
+                                 "manage.py.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="How much slower a benchmark may get "
+                                 "before it counts as a regression, as a "
+                                 "fraction of its baseline time.")
+
+    def handle(self, **options):
+        old_name = connection.creation.create_test_db(verbosity=0,
+                                                      autoclobber=True)
+        try:
+            results = benchmarks.run_benchmarks(options['quick'],
+                                                options['repeat'],
+                                                options['only'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if not os.path.exists(options['baseline']):
+            return
+        with open(options['baseline']) as f:
+            baseline = json.load(f)
+        regressions = benchmarks.compare(results, baseline,
+                                         options['tolerance'])
+        if regressions:
+            raise CommandError('Slower than the baseline:\n' + '\n'.join(
+                '{}: {:.3f}ms -> {:.3f}ms'.format(name, old * 1000, new * 1000)
+                for name, old, new in regressions))
@@ -1,5 +1,8 @@
 """Tests for the CombinedForm utilitiy class."""
+import asyncio
+import concurrent.futures
 import datetime
+import threading
 import unittest
 import unittest.mock
 
@@ -10,6 +13,17 @@ import django.utils.timezone
 
 import combinedform
 
+from . import benchmarks
+
+
+def run(coroutine):
+    """Run ``coroutine`` to completion and return its result."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
 
 class CombinedFormTest(unittest.TestCase):
     """Tests for the CombinedForm utility class."""
@@ -22,6 +36,9 @@ class CombinedFormTest(unittest.TestCase):
 
         inst = MyCombinedForm()
         self.assertEqual(list(inst.keys()), ['form1'])
+        # callers get their own list, as before
+        inst.keys().append('form2')
+        self.assertEqual(['form1'], inst.keys())
 
     def test_subform_arguments(self):
         """subform__arg will get sent to the right subform."""
@@ -45,6 +62,63 @@ class CombinedFormTest(unittest.TestCase):
         Combined(form2__foo='bar')
         subform_a.assert_called_with()
 
+    def test_subform_arguments_routed_consistently(self):
+        """Repeated construction routes subform__arg kwargs the same way."""
+        subform_mock = unittest.mock.MagicMock()
+
+        class MyCombinedForm(combinedform.CombinedForm):
+            form1 = combinedform.Subform(subform_mock)
+
+        for _ in range(2):
+            MyCombinedForm(form1__foo='bar', other__baz='qux')
+            subform_mock.assert_called_with(foo='bar', other__baz='qux')
+        self.assertEqual({'form1__foo': ('form1', 'foo'), 'other__baz': None},
+                         MyCombinedForm._kwarg_routes)
+
+    def test_getitem(self):
+        """Subforms are available by name, unknown names raise."""
+        subform_mock = unittest.mock.MagicMock()
+
+        class MyCombinedForm(combinedform.CombinedForm):
+            form1 = combinedform.Subform(subform_mock)
+
+        inst = MyCombinedForm()
+        self.assertIs(inst.form1, inst['form1'])
+        with self.assertRaises(AttributeError):
+            inst['validators']
+
+    def test_lazy_subforms(self):
+        """In lazy mode subforms are only built when first accessed."""
+        subform_a = unittest.mock.MagicMock()
+        subform_b = unittest.mock.MagicMock()
+
+        class Combined(combinedform.CombinedForm):
+            form1 = combinedform.Subform(subform_a)
+            form2 = combinedform.Subform(subform_b)
+
+        inst = Combined(form1__foo='bar', lazy=True)
+        self.assertFalse(subform_a.called)
+        self.assertFalse(subform_b.called)
+
+        self.assertIs(inst.form1, inst['form1'])
+        subform_a.assert_called_once_with(foo='bar')
+        self.assertFalse(subform_b.called)
+
+        inst.is_valid()
+        subform_b.assert_called_once_with()
+
+    def test_lazy_subform_errors_wrapped(self):
+        """A lazy subform which fails to build raises SubformError."""
+        subform = unittest.mock.MagicMock(side_effect=ValueError('boom'))
+
+        class Combined(combinedform.CombinedForm):
+            form1 = combinedform.Subform(subform)
+            lazy_subforms = True
+
+        inst = Combined()
+        with self.assertRaisesRegex(combinedform.SubformError, 'form1'):
+            inst.form1
+
     def test_global_args(self):
         """Arguments get sent to all subforms."""
         subform_a = unittest.mock.MagicMock()
@@ -119,6 +193,326 @@ class CombinedFormTest(unittest.TestCase):
         validator1.assert_called_with(inst)
         validator2.assert_called_with(inst)
 
+    def test_declared_validators_all_run(self):
+        """Declared validators run when their own inputs are valid."""
+
+        class FormA(django.forms.Form):
+            x = django.forms.IntegerField()
+            y = django.forms.IntegerField()
+
+        class FormB(django.forms.Form):
+            z = django.forms.IntegerField()
+
+        calls = []
+
+        @combinedform.validates('a.x')
+        def check_x(form):
+            calls.append('x')
+            raise django.forms.ValidationError("bad x")
+
+        @combinedform.validates('a.x', 'b')
+        def check_x_and_b(form):
+            calls.append('x and b')
+
+        @combinedform.validates('a.y')
+        def check_y(form):
+            calls.append('y')
+            raise django.forms.ValidationError("bad y")
+
+        def check_all(form):
+            calls.append('all')
+
+        class Combined(combinedform.CombinedForm):
+            a = combinedform.Subform(FormA, prefix='a')
+            b = combinedform.Subform(FormB, prefix='b')
+            validators = [check_x, check_x_and_b, check_y, check_all]
+
+        inst = Combined({'a-x': '1', 'a-y': '2', 'b-z': 'not a number'})
+        self.assertFalse(inst.is_valid())
+        self.assertEqual(['x', 'y'], calls)
+        self.assertEqual(['bad x', 'bad y'], inst.non_field_errors)
+
+    def test_declared_validators_rerun_on_change(self):
+        """Revalidation only reruns validators whose inputs changed."""
+
+        class FormA(django.forms.Form):
+            x = django.forms.IntegerField()
+            y = django.forms.IntegerField()
+
+        checked = []
+
+        @combinedform.validates('a.x')
+        def check_x(form):
+            checked.append(form.a.cleaned_data['x'])
+            raise combinedform.FieldValidationError('a', {'x': ['bad x']})
+
+        class Combined(combinedform.CombinedForm):
+            a = combinedform.Subform(FormA)
+            validators = [check_x]
+
+        inst = Combined({'x': '1', 'y': '2'})
+        self.assertFalse(inst.is_valid())
+        inst.a.data = {'x': '1', 'y': '3'}
+        self.assertFalse(inst.is_valid())
+        self.assertEqual([1], checked)
+        self.assertEqual(['bad x'], inst.a.errors['x'])
+
+        inst.a.data = {'x': '4', 'y': '3'}
+        self.assertFalse(inst.is_valid())
+        self.assertEqual([1, 4], checked)
+
+        self.assertFalse(inst.is_valid(revalidate=True))
+        self.assertEqual([1, 4, 4], checked)
+
+    def test_validators_see_earlier_failures(self):
+        """A failed validator stops the ones which read what it rejected."""
+
+        class FormA(django.forms.Form):
+            x = django.forms.IntegerField()
+
+        def make_validators():
+            def reject_x(form):
+                raise combinedform.FieldValidationError('a', {'x': ['bad x']})
+
+            def read_x(form):
+                return form.a.cleaned_data['x']
+
+            return [reject_x, read_x]
+
+        declared = [combinedform.validates('a.x')(validator)
+                    for validator in make_validators()]
+        for validators in (make_validators(), declared):
+
+            class Combined(combinedform.CombinedForm):
+                a = combinedform.Subform(FormA)
+
+            Combined.validators = validators
+            inst = Combined({'x': '1'})
+            self.assertFalse(inst.is_valid())
+            self.assertEqual(['bad x'], inst.a.errors['x'])
+
+            inst = Combined({'x': '1'})
+            self.assertFalse(run(inst.ais_valid()))
+            self.assertEqual(['bad x'], inst.a.errors['x'])
+
+    def test_validate_partial(self):
+        """validate_partial() checks only the requested fields."""
+
+        class FormA(django.forms.Form):
+            x = django.forms.IntegerField()
+            y = django.forms.IntegerField()
+
+        other = unittest.mock.MagicMock()
+
+        @combinedform.validates('a.x')
+        def check_x(form):
+            if form.a.cleaned_data['x'] > 10:
+                raise django.forms.ValidationError("x too big")
+
+        @combinedform.validates('a.x', 'a.y')
+        def check_x_and_y(form):
+            raise AssertionError("needs a field that wasn't sent")
+
+        class Combined(combinedform.CombinedForm):
+            a = combinedform.Subform(FormA, prefix='a')
+            b = combinedform.Subform(other)
+            validators = [check_x, check_x_and_y]
+
+        self.assertEqual(
+            {}, Combined.validate_partial({'a-x': '5'}, 'a', fields=['x']))
+        self.assertEqual(
+            {'__all__': ['x too big']},
+            Combined.validate_partial({'a-x': '50'}, 'a', fields=['x']))
+        self.assertEqual(
+            {'x': ['Enter a whole number.']},
+            Combined.validate_partial({'a-x': 'no'}, 'a', fields=['x']))
+        self.assertFalse(other.called)
+
+    def test_iter_render(self):
+        """iter_render() yields the as_*() output a piece at a time."""
+
+        class MyForm(django.forms.Form):
+            my_field = django.forms.CharField(help_text='help')
+
+        MyFormSet = django.forms.formsets.formset_factory(MyForm, extra=3)
+
+        class Combined(combinedform.CombinedForm):
+            form = combinedform.Subform(MyForm, prefix='form')
+            formset = combinedform.Subform(MyFormSet, prefix='formset')
+
+        inst = Combined()
+        for style in ('p', 'table', 'ul'):
+            pieces = list(inst.iter_render(style))
+            self.assertGreater(len(pieces), 4)  # form, management, rows
+            expected = (getattr(inst.form, 'as_' + style)() +
+                        getattr(inst.formset, 'as_' + style)())
+            self.assertEqual(expected, ''.join(pieces))
+            self.assertEqual(expected, getattr(inst, 'as_' + style)())
+
+        self.assertIn('<div><label for="id_form-my_field">', inst.as_div())
+
+    def test_errors_json(self):
+        """errors.get_json_data() gives codes and params without rendering."""
+
+        class MyForm(django.forms.Form):
+            my_field = django.forms.CharField(max_length=1)
+
+        MyFormSet = django.forms.formsets.formset_factory(MyForm, max_num=1,
+                                                          validate_max=True)
+
+        @combinedform.validates('form')
+        def validator(form):
+            raise django.forms.ValidationError('Bad %(thing)s', code='bad',
+                                               params={'thing': '<b>'})
+
+        class Combined(combinedform.CombinedForm):
+            form = combinedform.Subform(MyForm, prefix='form')
+            formset = combinedform.Subform(MyFormSet, prefix='formset')
+            validators = [validator]
+
+        inst = Combined(data={
+            'form-my_field': 'x',
+            'formset-TOTAL_FORMS': '2', 'formset-INITIAL_FORMS': '0',
+            'formset-0-my_field': 'xx', 'formset-1-my_field': 'x',
+        })
+        self.assertFalse(inst.is_valid())
+
+        max_length = {'message': 'Ensure this value has at most 1 character '
+                                 '(it has 2).',
+                      'code': 'max_length',
+                      'params': {'limit_value': 1, 'show_value': 2,
+                                 'value': 'xx'}}
+        data = inst.errors.get_json_data()
+        self.assertEqual([{'my_field': [max_length]}, {}], data['formset'])
+        self.assertNotIn('form', data)
+        self.assertEqual(
+            [{'message': 'Bad <b>', 'code': 'bad', 'params': {'thing': '<b>'},
+              'subform': None},
+             {'message': 'Please submit 1 or fewer forms.',
+              'code': 'too_many_forms', 'params': {}, 'subform': 'formset'}],
+            data['__all__'])
+        self.assertIn('"Bad &lt;b&gt;"', inst.errors.as_json(escape_html=True))
+        self.assertEqual(['Bad <b>', 'Please submit 1 or fewer forms.'],
+                         inst.non_field_errors)
+
+    def test_from_nested(self):
+        """from_nested() binds nested data like the equivalent flat data."""
+
+        class MyForm(django.forms.Form):
+            name = django.forms.CharField()
+            tags = django.forms.MultipleChoiceField(
+                choices=[('a', 'A'), ('b', 'B')], required=False)
+
+        MyFormSet = django.forms.formsets.formset_factory(MyForm)
+
+        class Combined(combinedform.CombinedForm):
+            form = combinedform.Subform(MyForm, prefix='person')
+            formset = combinedform.Subform(MyFormSet)
+            other = combinedform.Subform(MyForm)
+
+        inst = Combined.from_nested({
+            'form': {'name': 'Bob', 'tags': ['a', 'b']},
+            'formset': [{'name': 'Al'}, {'name': 'Jo', 'tags': ['b']}],
+        }, other__prefix='another')
+        self.assertTrue(inst.form.is_valid(), inst.form.errors)
+        self.assertEqual({'name': 'Bob', 'tags': ['a', 'b']},
+                         inst.form.cleaned_data)
+        self.assertTrue(inst.formset.is_valid(), inst.formset.errors)
+        self.assertEqual([{'name': 'Al', 'tags': []},
+                          {'name': 'Jo', 'tags': ['b']}],
+                         inst.formset.cleaned_data)
+        self.assertEqual('another', inst.other.prefix)
+        self.assertEqual({'name': ['This field is required.']},
+                         inst.other.errors)
+
+        data = combinedform.NestedFormData({'name': 'Bob'}, 'person')
+        self.assertEqual(['Bob'], list(data.values()))
+        self.assertEqual({'person-name': 'Bob'}, dict(data))
+
+        rows = [{'id': 1}, {'id': ''}, {'id': 2}]
+        with self.assertRaises(ValueError):
+            combinedform.NestedFormsetData(rows, 'rows', 'id')
+        data = combinedform.NestedFormsetData(rows[:2], 'rows', 'id')
+        self.assertEqual(1, data['rows-INITIAL_FORMS'])
+
+        class ModelCombined(combinedform.CombinedForm):
+            form = combinedform.Subform(MyForm)
+            formset = combinedform.Subform(MyFormSet)
+            groups = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    django.contrib.auth.models.Group, fields=('name',)))
+
+        bad_shapes = [
+            ({'form': ['Bob']}, 'form'),
+            ({'form': 'Bob'}, 'form'),
+            ({'formset': ['x']}, 'formset'),
+            ({'formset': {'name': 'Al'}}, 'formset'),
+            ({'groups': rows}, 'groups'),
+            (['form'], '__all__'),
+        ]
+        for data, subform in bad_shapes:
+            with self.assertRaises(django.forms.ValidationError) as cm:
+                ModelCombined.from_nested(data)
+            self.assertEqual([subform], list(cm.exception.message_dict))
+
+    def test_render_invalid(self):
+        """render_invalid() only renders subforms with errors."""
+
+        class MyForm(django.forms.Form):
+            my_field = django.forms.CharField()
+
+        @combinedform.validates('good')
+        def validator(form):
+            raise django.forms.ValidationError('Wrong')
+
+        class Combined(combinedform.CombinedForm):
+            good = combinedform.Subform(MyForm, prefix='good')
+            bad = combinedform.Subform(MyForm, prefix='bad')
+            validators = [validator]
+
+        inst = Combined(data={'good-my_field': 'x'})
+        self.assertFalse(inst.is_valid())
+        self.assertEqual(['bad', '__all__'], list(inst.render_invalid()))
+        fragments = inst.render_invalid('ul')
+        self.assertEqual(inst.bad.as_ul(), fragments['bad'])
+        self.assertEqual('<ul class="errorlist"><li>Wrong</li></ul>',
+                         fragments['__all__'])
+
+        inst = Combined(data={'good-my_field': 'x', 'bad-my_field': 'y'})
+        inst.validators = []
+        self.assertEqual({}, inst.render_invalid())
+
+    def test_fragment_cache(self):
+        """Unbound subforms are rendered once, then come from the cache."""
+
+        class MyForm(django.forms.Form):
+            my_field = django.forms.CharField()
+
+        class Combined(combinedform.CombinedForm):
+            form = combinedform.Subform(MyForm, prefix='form')
+            fragment_cache = combinedform.LRUFragmentCache(max_entries=2)
+
+        expected = Combined().as_p()
+        with unittest.mock.patch('combinedform.combinedform.render_form',
+                                 side_effect=AssertionError):
+            self.assertEqual(expected, Combined().as_p())
+        self.assertNotEqual(expected, Combined(form__initial={'my_field': 'x'})
+                            .as_p())
+        self.assertEqual(2, len(Combined.fragment_cache))
+
+        Combined().as_ul()  # evicts the oldest fragment
+        self.assertEqual(2, len(Combined.fragment_cache))
+        self.assertIsNone(Combined.fragment_cache.get(
+            Combined._fragment_namespace(),
+            Combined().fragment_key('form', Combined().form, 'p')))
+
+        Combined.invalidate_fragments()
+        self.assertEqual(0, len(Combined.fragment_cache))
+
+        bound = Combined(data={'form-my_field': ''})
+        self.assertIn('errorlist', bound.as_p())
+        self.assertEqual(0, len(Combined.fragment_cache))
+
     def test_forms_valid_when_no_validators(self):
         """When there are no validators, forms_valid() is True."""
 
@@ -151,6 +545,50 @@ class CombinedFormTest(unittest.TestCase):
         inst.forms_valid()
         self.assertEqual(inst.non_field_errors, ['Invalid'])
 
+    def test_is_valid_remembers_outcome(self):
+        """Validators run once, however often is_valid() is asked."""
+        validator = unittest.mock.MagicMock(
+            side_effect=django.forms.ValidationError("Invalid"))
+
+        class Combined(combinedform.CombinedForm):
+            validators = [validator]
+            form1 = combinedform.Subform(unittest.mock.MagicMock())
+
+        inst = Combined()
+        self.assertFalse(inst.is_valid())
+        self.assertFalse(inst.is_valid())
+        self.assertEqual(1, validator.call_count)
+
+        self.assertFalse(inst.is_valid(revalidate=True))
+        self.assertEqual(2, validator.call_count)
+        self.assertEqual(['Invalid'], inst.non_field_errors)
+
+    def test_is_valid_revalidates_new_data(self):
+        """Replacing a subform's data means validating again."""
+
+        def validator(form):
+            raise combinedform.FieldValidationError(
+                'my_form', {'my_field': ['foo']})
+
+        class MyForm(django.forms.Form):
+            my_field = django.forms.CharField()
+
+        class Combined(combinedform.CombinedForm):
+            my_form = combinedform.Subform(MyForm)
+            validators = [validator]
+
+        inst = Combined({})
+        self.assertFalse(inst.is_valid())
+        self.assertFalse(inst.is_valid())
+        self.assertEqual(['This field is required.'],
+                         inst.my_form.errors['my_field'])
+
+        inst.my_form.data = {'my_field': 'x'}
+        self.assertFalse(inst.is_valid())
+        self.assertEqual(['foo'], inst.my_form.errors['my_field'])
+        self.assertFalse(inst.is_valid(revalidate=True))
+        self.assertEqual(['foo'], inst.my_form.errors['my_field'])
+
     def test_iterator_returns_keys(self):
         """The iterator yields the subform names."""
         form_a = unittest.mock.MagicMock()
@@ -190,6 +628,112 @@ class CombinedFormTest(unittest.TestCase):
 
         self.assertFalse(Combined().subforms_valid())
 
+    def test_concurrent_subform_validation(self):
+        """Subforms can be validated on a thread pool."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        class SlowForm(django.forms.Form):
+            field = django.forms.CharField()
+
+            def clean(self):
+                barrier.wait()  # only passes if both subforms run at once
+                return super().clean()
+
+        class Combined(combinedform.CombinedForm):
+            form1 = combinedform.Subform(SlowForm, prefix='a')
+            form2 = combinedform.Subform(SlowForm, prefix='b')
+            validation_executor = 2
+
+        self.assertFalse(Combined({'a-field': 'x'}).subforms_valid())
+        self.assertTrue(Combined({'a-field': 'x', 'b-field': 'y'}).is_valid())
+
+    def test_concurrent_validation_errors_wrapped(self):
+        """Errors raised on a pool thread name the subform."""
+        good = unittest.mock.MagicMock()
+        bad = unittest.mock.MagicMock()
+        bad().is_valid.side_effect = ValueError('boom')
+
+        class Combined(combinedform.CombinedForm):
+            form1 = combinedform.Subform(good)
+            form2 = combinedform.Subform(bad)
+
+        with concurrent.futures.ThreadPoolExecutor(2) as pool:
+            Combined.validation_executor = pool
+            with self.assertRaisesRegex(combinedform.SubformError, 'form2'):
+                Combined().subforms_valid()
+
+    def test_ais_valid_mixes_validators(self):
+        """ais_valid() awaits async validators together with sync ones."""
+        started = {}
+        sync_validator = unittest.mock.MagicMock()
+
+        async def waits(form):
+            # only finishes if the other validator runs at the same time
+            await started.setdefault('event', asyncio.Event()).wait()
+
+        async def fails(form):
+            started.setdefault('event', asyncio.Event()).set()
+            raise django.forms.ValidationError("Invalid")
+
+        class Combined(combinedform.CombinedForm):
+            validators = [waits, sync_validator, fails]
+            form1 = combinedform.Subform(unittest.mock.MagicMock())
+
+        inst = Combined()
+        self.assertFalse(run(inst.ais_valid()))
+        sync_validator.assert_called_once_with(inst)
+        self.assertEqual(['Invalid'], inst.non_field_errors)
+
+    def test_ais_valid_blocks_off_the_loop(self):
+        """ais_valid() runs plain validation code on a worker thread."""
+        threads = {}
+
+        class MyForm(django.forms.Form):
+            name = django.forms.CharField()
+
+            def clean_name(self):
+                threads['clean'] = threading.get_ident()
+                return self.cleaned_data['name']
+
+        def sync_validator(form):
+            threads['sync'] = threading.get_ident()
+
+        async def async_validator(form):
+            threads['async'] = threading.get_ident()
+
+        class Combined(combinedform.CombinedForm):
+            validators = [sync_validator, async_validator]
+            form1 = combinedform.Subform(MyForm)
+
+        async def check():
+            loop_thread = threading.get_ident()
+            self.assertTrue(await Combined({'name': 'x'}).ais_valid())
+            return loop_thread
+
+        closed = []
+        with unittest.mock.patch.object(
+                django.db.connections, 'close_all',
+                side_effect=lambda: closed.append(threading.get_ident())):
+            loop_thread = run(check())
+        self.assertNotEqual(loop_thread, threads['clean'])
+        self.assertNotEqual(loop_thread, threads['sync'])
+        self.assertEqual(loop_thread, threads['async'])
+        if combinedform.combinedform.sync_to_async is None:
+            # worker threads close the connections they open
+            self.assertIn(threads['clean'], closed)
+            self.assertIn(threads['sync'], closed)
+
+    def test_sync_is_valid_runs_async_validators(self):
+        """is_valid() runs coroutine validators to completion."""
+
+        async def fails(form):
+            raise django.forms.ValidationError("Invalid")
+
+        class Combined(combinedform.CombinedForm):
+            validators = [fails]
+
+        self.assertFalse(Combined().is_valid())
+
     def test_is_valid_true_when_all_valid(self):
         """is_valid() is True if subforms and CombinedForm are both valid."""
 
@@ -507,10 +1051,79 @@ class OrderByDependencyTest(unittest.TestCase):
         result = self.stringify(result)
         self.assertIn(result, ["1 2 3 4", "2 1 3 4"])
 
+    def test_diamonds(self):
+        """Deep diamond-shaped dependency graphs are ordered quickly."""
+        previous = []
+        levels = []
+        for level in range(30):
+            current = []
+            for side in 'lr':
+                attrs = {'__module__': __name__}
+                for i, dependency in enumerate(previous):
+                    attrs['fk{}'.format(i)] = django.db.models.ForeignKey(
+                        dependency)
+                name = 'Diamond{}{}'.format(level, side)
+                current.append(type(name, (django.db.models.Model,), attrs))
+            levels.append(current)
+            previous = current
+
+        models = [m for level in reversed(levels) for m in level]
+        result = combinedform.order_by_dependency(models)
+        self.assertEqual([m for level in levels for m in level], result)
+
+    def test_cycle_raises(self):
+        """A cycle of non-nullable ForeignKeys names the models involved."""
+
+        class CycleA(django.db.models.Model):
+            b = django.db.models.ForeignKey('CycleB')
+
+        class CycleB(django.db.models.Model):
+            a = django.db.models.ForeignKey(CycleA)
+
+        class CycleC(django.db.models.Model):
+            pass
+
+        with self.assertRaises(combinedform.DependencyCycleError) as cm:
+            combinedform.order_by_dependency([CycleC, CycleA, CycleB])
+        self.assertEqual([CycleA, CycleB], cm.exception.models)
+        self.assertIn('CycleA, CycleB', str(cm.exception))
+
+    def test_nullable_cycle_deferred(self):
+        """A nullable link that closes a cycle is deferred."""
+
+        class CyclicParent(django.db.models.Model):
+            favorite = django.db.models.ForeignKey('CyclicChild', null=True)
+
+        class CyclicChild(django.db.models.Model):
+            parent = django.db.models.ForeignKey(CyclicParent)
+
+        plan = combinedform.resolve_dependencies([CyclicChild, CyclicParent])
+        self.assertEqual((CyclicParent, CyclicChild), plan.order)
+        self.assertEqual(
+            ((CyclicParent, CyclicParent._meta.get_field('favorite')),),
+            plan.deferred)
+
+    def test_self_foreignkey_deferred(self):
+        """A ForeignKey from a model to itself is deferred."""
+
+        class TreeNode(django.db.models.Model):
+            parent = django.db.models.ForeignKey('self', null=True)
+
+        plan = combinedform.resolve_dependencies([TreeNode])
+        self.assertEqual((TreeNode,), plan.order)
+        self.assertEqual(
+            ((TreeNode, TreeNode._meta.get_field('parent')),), plan.deferred)
+
 
 class CombinedFormIntegrationTest(django.test.TestCase):
     """Test the features of CombinedForm which use the database."""
 
+    def create_tables(self, *models):
+        """Create database tables for models declared inside a test."""
+        with django.db.connection.schema_editor() as editor:
+            for model in models:
+                editor.create_model(model)
+
     def test_dependency_saving(self):
         """Test models are saved in a safe order and properly linked."""
 
@@ -569,6 +1182,744 @@ class CombinedFormIntegrationTest(django.test.TestCase):
         self.assertTrue(isinstance(buzz.bar.foo, ModelFoo))
         self.assertEqual(buzz.bar.foo.description, 'an')
 
+    def test_save_plan(self):
+        """The save plan is compiled once per class and can be inspected."""
+
+        class PlanOwner(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class PlanItem(django.db.models.Model):
+            owner = django.db.models.ForeignKey(PlanOwner)
+
+        class OwnerForm(django.forms.ModelForm):
+            class Meta:
+                model = PlanOwner
+                fields = ('name',)
+
+        ItemFormset = django.forms.models.modelformset_factory(
+            PlanItem, fields=())
+
+        class TheForm(combinedform.CombinedForm):
+            items = combinedform.Subform(ItemFormset)
+            owner = combinedform.Subform(OwnerForm)
+
+        plan = TheForm.get_save_plan()
+        self.assertEqual((PlanOwner, PlanItem), plan.order)
+        self.assertEqual('items', plan.formnames[PlanItem])
+        self.assertEqual((PlanItem._meta.get_field('owner'),),
+                         plan.links[PlanItem])
+        self.assertEqual({'owner': 'form', 'items': 'formset'},
+                         dict(plan.kinds))
+        self.assertEqual(frozenset([PlanOwner]), plan.owners)
+        self.assertIs(plan, TheForm.get_save_plan())
+
+        class PlanUnrelated(django.db.models.Model):
+            pass
+
+        # registering a model expires the cached plan
+        self.assertIsNot(plan, TheForm.get_save_plan())
+        self.assertEqual(plan, TheForm.get_save_plan())
+
+    def test_bulk_save(self):
+        """bulk=True inserts all new formset rows in a single query."""
+
+        class BulkOrder(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class BulkLine(django.db.models.Model):
+            title = django.db.models.CharField(max_length=20)
+            order = django.db.models.ForeignKey(BulkOrder)
+
+        self.create_tables(BulkOrder, BulkLine)
+
+        class OrderForm(django.forms.ModelForm):
+            class Meta:
+                model = BulkOrder
+                fields = ('name',)
+
+        LineFormset = django.forms.models.inlineformset_factory(
+            BulkOrder, BulkLine, fields=('title',), can_delete=False)
+
+        class TheForm(combinedform.CombinedForm):
+            order = combinedform.Subform(OrderForm)
+            lines = combinedform.Subform(LineFormset, prefix='lines')
+
+        formdata = {'name': 'o1',
+                    'lines-TOTAL_FORMS': 3,
+                    'lines-INITIAL_FORMS': 0,
+                    'lines-MAX_NUM_FORMS': 1000}
+        for i in range(3):
+            formdata['lines-{}-title'.format(i)] = 'line {}'.format(i)
+
+        inst = TheForm(formdata)
+        self.assertTrue(inst.is_valid(), inst.errors)
+        with self.assertNumQueries(2):  # the order, then all the lines
+            inst.save(bulk=True, atomic=False)
+
+        order = BulkOrder.objects.get()
+        self.assertEqual(
+            ['line 0', 'line 1', 'line 2'],
+            sorted(order.bulkline_set.values_list('title', flat=True)))
+
+    def test_deferred_link_saved(self):
+        """A nullable back-reference is filled in after both models exist."""
+
+        class Team(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+            captain = django.db.models.ForeignKey('Player', null=True,
+                                                  related_name='+')
+
+        class Player(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+            team = django.db.models.ForeignKey(Team)
+
+        self.create_tables(Team, Player)
+
+        class TeamForm(django.forms.ModelForm):
+            class Meta:
+                model = Team
+                fields = ('name',)
+
+        class PlayerForm(django.forms.ModelForm):
+            class Meta:
+                model = Player
+                fields = ('name',)
+
+        class TheForm(combinedform.CombinedForm):
+            player = combinedform.Subform(PlayerForm, prefix='player')
+            team = combinedform.Subform(TeamForm, prefix='team')
+
+        inst = TheForm({'player-name': 'ann', 'team-name': 'reds'})
+        self.assertTrue(inst.is_valid(), inst.errors)
+        inst.save()
+
+        team = Team.objects.get()
+        self.assertEqual('ann', team.captain.name)
+        self.assertEqual(team, team.captain.team)
+
+    def test_self_reference_left_alone(self):
+        """A ForeignKey to the same model keeps the value the form gave."""
+
+        class Category(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+            parent = django.db.models.ForeignKey('self', null=True,
+                                                 blank=True)
+
+        self.create_tables(Category)
+        root = Category.objects.create(name='root')
+
+        class OneForm(combinedform.CombinedForm):
+            category = combinedform.Subform(
+                django.forms.models.modelform_factory(
+                    Category, fields=('name', 'parent')),
+                prefix='category')
+
+        inst = OneForm({'category-name': 'leaf', 'category-parent': root.pk})
+        self.assertTrue(inst.is_valid(), inst.errors)
+        leaf = inst.save()['category']
+        self.assertEqual(root.pk, Category.objects.get(pk=leaf.pk).parent_id)
+
+        class ManyForm(combinedform.CombinedForm):
+            categories = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    Category, fields=('name', 'parent'), extra=2),
+                prefix='categories', queryset=Category.objects.none())
+
+        inst = ManyForm({'categories-TOTAL_FORMS': 2,
+                         'categories-INITIAL_FORMS': 0,
+                         'categories-0-name': 'a',
+                         'categories-0-parent': root.pk,
+                         'categories-1-name': 'b'})
+        self.assertTrue(inst.is_valid(), inst.errors)
+        inst.save()
+        self.assertEqual(
+            [('a', root.pk), ('b', None)],
+            list(Category.objects.filter(name__in=('a', 'b'))
+                 .order_by('name').values_list('name', 'parent_id')))
+
+    def test_back_reference_to_formset_left_alone(self):
+        """A deferred link to a formset's model isn't filled in."""
+
+        class Club(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+            captain = django.db.models.ForeignKey('Member', null=True,
+                                                  related_name='+')
+
+        class Member(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+            club = django.db.models.ForeignKey(Club)
+
+        self.create_tables(Club, Member)
+
+        class TheForm(combinedform.CombinedForm):
+            club = combinedform.Subform(
+                django.forms.models.modelform_factory(Club,
+                                                      fields=('name',)),
+                prefix='club')
+            members = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    Member, fields=('name',), extra=2),
+                prefix='members', queryset=Member.objects.none())
+
+        inst = TheForm({'club-name': 'reds', 'members-TOTAL_FORMS': 2,
+                        'members-INITIAL_FORMS': 0,
+                        'members-0-name': 'ann', 'members-1-name': 'bob'})
+        self.assertTrue(inst.is_valid(), inst.errors)
+        inst.save()
+
+        club = Club.objects.get()
+        self.assertIsNone(club.captain)
+        self.assertEqual(['ann', 'bob'], sorted(
+            club.member_set.values_list('name', flat=True)))
+
+    def test_instrumentation(self):
+        """Hooks get timed events for each step, aggregated by phase."""
+
+        class TimedThing(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        self.create_tables(TimedThing)
+
+        class ThingForm(django.forms.ModelForm):
+            class Meta:
+                model = TimedThing
+                fields = ('name',)
+
+        def check_name(form):
+            raise django.forms.ValidationError('Bad name')
+
+        events = []
+        timings = combinedform.TimingAggregator()
+
+        class TheForm(combinedform.CombinedForm):
+            thing = combinedform.Subform(ThingForm)
+            instruments = [events.append, timings]
+
+        inst = TheForm({'name': 'x'})
+        self.assertTrue(inst.is_valid())
+        inst.save()
+        inst.validators = [check_name]
+        self.assertFalse(inst.is_valid(revalidate=True))
+
+        self.assertEqual(
+            [('init', 'thing'), ('validate', 'thing'),
+             ('save', 'testapp.TimedThing'), ('validate', 'thing'),
+             ('validator', 'check_name')],
+            [(event.phase, event.name) for event in events])
+        self.assertTrue(all(e.form_class is TheForm for e in events))
+        self.assertIsInstance(events[-1].exception,
+                              django.forms.ValidationError)
+        self.assertIsNone(events[0].exception)
+
+        summary = timings.summary()
+        self.assertEqual({'count': 2, 'errors': 0},
+                         {k: summary[TheForm, 'validate'][k]
+                          for k in ('count', 'errors')})
+        self.assertEqual(1, summary[TheForm, 'validator']['errors'])
+        self.assertEqual(events[2].duration,
+                         timings.percentile(TheForm, 'save', 99))
+
+    def test_query_counter(self):
+        """QueryCounter attributes queries to subforms and phases."""
+
+        class Colour(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Paint(django.db.models.Model):
+            colour = django.db.models.ForeignKey(Colour)
+
+        self.create_tables(Colour, Paint)
+        red = Colour.objects.create(name='red')
+
+        PaintFormset = django.forms.models.modelformset_factory(
+            Paint, fields=('colour',), extra=0)
+
+        class TheForm(combinedform.CombinedForm):
+            paints = combinedform.Subform(PaintFormset, prefix='paints')
+
+        formdata = {'paints-TOTAL_FORMS': 3, 'paints-INITIAL_FORMS': 0}
+        for i in range(3):
+            formdata['paints-{}-colour'.format(i)] = red.pk
+
+        with combinedform.QueryCounter() as queries:
+            Colour.objects.count()
+            inst = TheForm(formdata)
+            self.assertTrue(inst.is_valid(), inst.errors)
+            inst.save(atomic=False)
+
+        self.assertEqual(3, queries.count(TheForm, 'save', 'testapp.Paint'))
+        outside, = [s for s in queries.report() if s.form_class is None]
+        self.assertEqual(1, outside.count)
+        validate, = [s for s in queries.report() if s.phase == 'validate']
+        # each row looks up its colour, then model validation checks it exists
+        self.assertEqual(('paints', 6), (validate.name, validate.count))
+        self.assertEqual([3, 3], list(validate.duplicates.values()))
+        self.assertIn('TheForm validate paints: 6 queries', queries.summary())
+        self.assertEqual([], combinedform.instrumentation.hooks)
+
+        inst.save()
+        self.assertEqual(10, queries.count())  # no longer counting
+
+    def test_share_choices(self):
+        """Rows of a formset share one evaluation of each queryset."""
+
+        class Swatch(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Shirt(django.db.models.Model):
+            body = django.db.models.ForeignKey(Swatch, related_name='+')
+            trim = django.db.models.ForeignKey(Swatch, related_name='+')
+
+        self.create_tables(Swatch, Shirt)
+        red = Swatch.objects.create(name='red')
+        blue = Swatch.objects.create(name='blue')
+
+        ShirtFormset = django.forms.models.modelformset_factory(
+            Shirt, fields=('body', 'trim'), extra=3)
+
+        class TheForm(combinedform.CombinedForm):
+            shirts = combinedform.Subform(
+                ShirtFormset, prefix='shirts',
+                queryset=Shirt.objects.none())
+            share_choices = True
+
+        with self.assertNumQueries(1):
+            html = TheForm().as_p()
+        self.assertEqual(6, html.count('<option value="{}">'.format(blue.pk)))
+
+        formdata = {'shirts-TOTAL_FORMS': 3, 'shirts-INITIAL_FORMS': 0}
+        for i in range(3):
+            formdata['shirts-{}-body'.format(i)] = red.pk
+            formdata['shirts-{}-trim'.format(i)] = str(blue.pk)
+        inst = TheForm(formdata)
+        # one for the choices, then model validation checks each link
+        with self.assertNumQueries(1 + 6):
+            self.assertTrue(inst.is_valid(), inst.errors)
+        self.assertEqual([blue] * 3, [f.cleaned_data['trim']
+                                      for f in inst.shirts])
+
+        formdata['shirts-0-trim'] = 'nope'
+        inst = TheForm(formdata)
+        self.assertFalse(inst.is_valid())
+        self.assertEqual({'trim': [
+            'Select a valid choice. That choice is not one of the available '
+            'choices.']}, inst.shirts.errors[0])
+
+        # a view narrowing the choices after the form is built
+        formdata['shirts-0-trim'] = blue.pk
+        inst = TheForm(formdata)
+        for form in inst.shirts:
+            form.fields['trim'].queryset = Swatch.objects.filter(name='red')
+        self.assertFalse(inst.is_valid())
+        self.assertIn('trim', inst.shirts.errors[0])
+
+    def test_for_instance(self):
+        """for_instance() loads related objects and routes them."""
+
+        class Region(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Client(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+            region = django.db.models.ForeignKey(Region)
+
+        class Invoice(django.db.models.Model):
+            number = django.db.models.IntegerField()
+            client = django.db.models.ForeignKey(Client)
+
+        class InvoiceLine(django.db.models.Model):
+            invoice = django.db.models.ForeignKey(Invoice)
+            amount = django.db.models.IntegerField()
+
+        class LineNote(django.db.models.Model):
+            line = django.db.models.ForeignKey(InvoiceLine)
+            text = django.db.models.CharField(max_length=20)
+
+        self.create_tables(Region, Client, Invoice, InvoiceLine, LineNote)
+        region = Region.objects.create(name='north')
+        client = Client.objects.create(name='acme', region=region)
+        invoice = Invoice.objects.create(number=1, client=client)
+        other = Invoice.objects.create(number=2, client=client)
+        line = InvoiceLine.objects.create(invoice=invoice, amount=3)
+        InvoiceLine.objects.create(invoice=other, amount=4)
+        note = LineNote.objects.create(line=line, text='hi')
+
+        modelform = django.forms.models.modelform_factory
+        modelformset = django.forms.models.modelformset_factory
+
+        class TheForm(combinedform.CombinedForm):
+            region = combinedform.Subform(modelform(Region, fields='__all__'),
+                                          prefix='region')
+            client = combinedform.Subform(modelform(Client, fields=('name',)),
+                                          prefix='client')
+            invoice = combinedform.Subform(
+                modelform(Invoice, fields=('number',)), prefix='invoice')
+            lines = combinedform.Subform(
+                django.forms.models.inlineformset_factory(
+                    Invoice, InvoiceLine, fields=('amount',)),
+                prefix='lines')
+            notes = combinedform.Subform(
+                modelformset(LineNote, fields=('text',)), prefix='notes')
+
+        with self.assertNumQueries(1):
+            inst = TheForm.for_instance(invoice)
+        self.assertIs(invoice, inst.invoice.instance)
+        self.assertEqual(client, inst.client.instance)
+        self.assertEqual(region, inst.region.instance)
+        self.assertEqual(invoice, inst.lines.instance)
+        with self.assertNumQueries(2):
+            self.assertEqual([line], [f.instance for f in inst.lines.forms
+                                      if f.instance.pk])
+            self.assertEqual([note], [f.instance for f in inst.notes.forms
+                                      if f.instance.pk])
+
+        inst = TheForm.for_instance(client, notes__queryset=[])
+        self.assertEqual(region, inst.region.instance)
+        self.assertEqual(invoice, inst.invoice.instance)  # the first one
+        self.assertEqual([], inst.notes.queryset)
+
+    def test_save_changed_only(self):
+        """changed_only writes just the changed fields of edited rows."""
+
+        class Grid(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Cell(django.db.models.Model):
+            grid = django.db.models.ForeignKey(Grid)
+            value = django.db.models.IntegerField()
+            note = django.db.models.CharField(max_length=20)
+
+        self.create_tables(Grid, Cell)
+        the_grid = Grid.objects.create(name='g')
+        cells = [Cell.objects.create(grid=the_grid, value=i, note='n')
+                 for i in range(3)]
+
+        class TheForm(combinedform.CombinedForm):
+            grid = combinedform.Subform(
+                django.forms.models.modelform_factory(Grid, fields='__all__'),
+                prefix='grid', instance=the_grid)
+            cells = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    Cell, fields=('value', 'note'), extra=1),
+                prefix='cells')
+            save_changed_only = True
+
+        formdata = {'grid-name': 'g', 'cells-TOTAL_FORMS': 4,
+                    'cells-INITIAL_FORMS': 3, 'cells-3-value': 9,
+                    'cells-3-note': 'new'}
+        for i, cell in enumerate(cells):
+            formdata['cells-{}-id'.format(i)] = cell.pk
+            formdata['cells-{}-value'.format(i)] = i * 10
+            formdata['cells-{}-note'.format(i)] = 'n'
+        inst = TheForm(formdata)
+        self.assertTrue(inst.is_valid(), inst.errors)
+
+        with django.test.utils.CaptureQueriesContext(
+                django.db.connection) as queries:
+            inst.save(atomic=False)
+        writes = [q['sql'] for q in queries.captured_queries
+                  if not q['sql'].startswith('SELECT')]
+        self.assertEqual(3, len(writes))  # two edited rows, one new row
+        self.assertTrue(all('"note"' not in sql for sql in writes
+                            if sql.startswith('UPDATE')))
+        self.assertEqual([(0, 'n'), (10, 'n'), (20, 'n'), (9, 'new')],
+                         list(Cell.objects.order_by('pk')
+                              .values_list('value', 'note')))
+
+    def test_save_deletes_marked_rows(self):
+        """Rows marked DELETE are deleted together, a model at a time."""
+
+        class Shelf(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Book(django.db.models.Model):
+            shelf = django.db.models.ForeignKey(Shelf)
+            title = django.db.models.CharField(max_length=20)
+
+        self.create_tables(Shelf, Book)
+        the_shelf = Shelf.objects.create(name='s')
+        for i in range(4):
+            Book.objects.create(shelf=the_shelf, title=str(i))
+
+        class TheForm(combinedform.CombinedForm):
+            shelf = combinedform.Subform(
+                django.forms.models.modelform_factory(Shelf, fields='__all__'),
+                prefix='shelf', instance=the_shelf)
+            books = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    Book, fields=('title',), extra=0, can_delete=True),
+                prefix='books')
+
+        def make_form(delete):
+            remaining = Book.objects.order_by('pk')
+            formdata = {'shelf-name': 's',
+                        'books-TOTAL_FORMS': len(remaining),
+                        'books-INITIAL_FORMS': len(remaining)}
+            for i, book in enumerate(remaining):
+                formdata['books-{}-id'.format(i)] = book.pk
+                formdata['books-{}-title'.format(i)] = book.title
+                if book.title in delete:
+                    formdata['books-{}-DELETE'.format(i)] = 'on'
+            inst = TheForm(formdata)
+            self.assertTrue(inst.is_valid(), inst.errors)
+            return inst
+
+        # nothing listens, so one statement deletes them all
+        inst = make_form(delete=('0', '2'))
+        with django.test.utils.CaptureQueriesContext(
+                django.db.connection) as queries:
+            inst.save()
+        deletes = [q['sql'] for q in queries.captured_queries
+                   if 'DELETE FROM' in q['sql']]
+        self.assertEqual(1, len(deletes))
+        self.assertEqual(['1', '3'], list(Book.objects.order_by('pk')
+                                          .values_list('title', flat=True)))
+
+        # signals are still sent for each instance when something listens
+        received = []
+
+        def receiver(sender, instance, **kwargs):
+            received.append(instance.title)
+
+        django.db.models.signals.pre_delete.connect(receiver, sender=Book)
+        self.addCleanup(django.db.models.signals.pre_delete.disconnect,
+                        receiver, sender=Book)
+        make_form(delete=('1', '3')).save()
+        self.assertEqual(['1', '3'], sorted(received))
+        self.assertFalse(Book.objects.exists())
+        self.assertTrue(Shelf.objects.filter(pk=the_shelf.pk).exists())
+
+    def test_save_atomic(self):
+        """save() makes its writes in a transaction, or a savepoint each."""
+
+        class Account(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Entry(django.db.models.Model):
+            account = django.db.models.ForeignKey(Account)
+            amount = django.db.models.IntegerField()
+
+            def save(self, *args, **kwargs):
+                super().save(*args, **kwargs)
+                if self.amount < 0:
+                    raise RuntimeError('negative')
+
+        self.create_tables(Account, Entry)
+
+        class TheForm(combinedform.CombinedForm):
+            account = combinedform.Subform(
+                django.forms.models.modelform_factory(Account,
+                                                      fields=('name',)),
+                prefix='account')
+            entry = combinedform.Subform(
+                django.forms.models.modelform_factory(Entry,
+                                                      fields=('amount',)),
+                prefix='entry')
+
+        def save(name, **kwargs):
+            inst = TheForm({'account-name': name, 'entry-amount': -1})
+            self.assertTrue(inst.is_valid(), inst.errors)
+            with self.assertRaises(RuntimeError):
+                inst.save(**kwargs)
+            return (Account.objects.filter(name=name).exists(),
+                    Entry.objects.filter(account__name=name).exists())
+
+        self.assertEqual((False, False), save('atomic'))
+        self.assertEqual((True, True), save('neither', atomic=False))
+        self.assertEqual((True, False),
+                         save('savepoints', atomic=False, savepoints=True))
+        self.assertEqual((False, False), save('using', using='default'))
+
+    def test_save_upsert(self):
+        """Resubmitting with upsert updates rows instead of duplicating."""
+
+        class Patient(django.db.models.Model):
+            code = django.db.models.CharField(max_length=20, unique=True)
+            name = django.db.models.CharField(max_length=20)
+            ward = django.db.models.CharField(max_length=20, default='')
+
+        class Visit(django.db.models.Model):
+            patient = django.db.models.ForeignKey(Patient)
+            day = django.db.models.IntegerField()
+            note = django.db.models.CharField(max_length=20)
+
+            class Meta:
+                unique_together = ('patient', 'day')
+
+        self.create_tables(Patient, Visit)
+
+        class TheForm(combinedform.CombinedForm):
+            patient = combinedform.Subform(
+                django.forms.models.modelform_factory(
+                    Patient, fields=('code', 'name')),
+                prefix='patient')
+            visits = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    Visit, fields=('day', 'note'), extra=2),
+                prefix='visits', queryset=Visit.objects.none())
+            natural_keys = {'patient': ('code',),
+                            'visits': ('patient', 'day')}
+            save_upsert = True
+
+        def submit(name, notes):
+            formdata = {'patient-code': 'p1', 'patient-name': name,
+                        'visits-TOTAL_FORMS': 2, 'visits-INITIAL_FORMS': 0}
+            for i, note in enumerate(notes):
+                formdata['visits-{}-day'.format(i)] = i + 1
+                formdata['visits-{}-note'.format(i)] = note
+            inst = TheForm(formdata)
+            self.assertTrue(inst.is_valid(), inst.errors)
+            return inst.save()
+
+        first = submit('Ann', ['a', 'b'])
+        Patient.objects.update(ward='east')  # not on the form
+        again = submit('Anne', ['a', 'c'])
+        self.assertEqual(first['patient'].pk, again['patient'].pk)
+        self.assertEqual([v.pk for v in first['visits']],
+                         [v.pk for v in again['visits']])
+        self.assertEqual([('p1', 'Anne', 'east')],
+                         list(Patient.objects.values_list('code', 'name',
+                                                          'ward')))
+        self.assertEqual([(1, 'a'), (2, 'c')],
+                         list(Visit.objects.filter(patient=again['patient'])
+                              .order_by('day').values_list('day', 'note')))
+
+        # a row inserted by someone else after the lookup gets updated
+        patient = Patient(code='p2', name='Bo')
+        writes = combinedform.combinedform.iter_upsert_writes(
+            Patient, [patient], ('code',), update_fields={'name'})
+        next(writes)()
+        other = Patient.objects.create(code='p2', name='B', ward='west')
+        for write in writes:
+            write()
+        self.assertEqual(other.pk, patient.pk)
+        self.assertEqual(('Bo', 'west'), Patient.objects.values_list(
+            'name', 'ward').get(code='p2'))
+
+        # without upsert, a taken natural key is a validation error
+        class PlainForm(TheForm):
+            save_upsert = False
+
+        inst = PlainForm({'patient-code': 'p1', 'patient-name': 'Ann',
+                          'visits-TOTAL_FORMS': 0,
+                          'visits-INITIAL_FORMS': 0})
+        self.assertFalse(inst.is_valid())
+        self.assertIn('code', inst.errors['patient'])
+
+    def test_benchmarks(self):
+        """The benchmarks run, and slower results count as regressions."""
+        results = benchmarks.run_benchmarks(quick=True, repeat=1,
+                                            only='fk_depth=3')
+        self.assertEqual({'is_valid[fk_depth=3]', 'save[fk_depth=3]'},
+                         set(results['results']))
+
+        self.assertEqual([], benchmarks.compare(results, results))
+        baseline = {'results': {'save[fk_depth=3]': {'median': 0}}}
+        regressions = benchmarks.compare(results, baseline)
+        self.assertEqual(['save[fk_depth=3]'],
+                         [name for name, _, _ in regressions])
+
+
+class CombinedFormTransactionTest(django.test.TransactionTestCase):
+    """Test the features of CombinedForm which manage transactions."""
+
+    def create_tables(self, *models):
+        """Create database tables for models declared inside a test.
+
+        Nothing rolls them back after the test, so they're dropped then.
+
+        """
+        with django.db.connection.schema_editor() as editor:
+            for model in models:
+                editor.create_model(model)
+        self.addCleanup(self.drop_tables, *models)
+
+    def drop_tables(self, *models):
+        with django.db.connection.schema_editor() as editor:
+            for model in reversed(models):
+                editor.delete_model(model)
+
+    def test_save_lock_and_retry(self):
+        """lock=True locks rows in order; transient failures are retried."""
+
+        class Basket(django.db.models.Model):
+            name = django.db.models.CharField(max_length=20)
+
+        class Fruit(django.db.models.Model):
+            basket = django.db.models.ForeignKey(Basket)
+            name = django.db.models.CharField(max_length=20)
+
+            failures = 0
+
+            def save(self, *args, **kwargs):
+                if Fruit.failures:
+                    Fruit.failures -= 1
+                    raise django.db.OperationalError('database is locked')
+                super().save(*args, **kwargs)
+
+        self.create_tables(Basket, Fruit)
+        the_basket = Basket.objects.create(name='b')
+        fruits = [Fruit.objects.create(basket=the_basket, name=name)
+                  for name in ('pear', 'apple')]
+
+        class TheForm(combinedform.CombinedForm):
+            basket = combinedform.Subform(
+                django.forms.models.modelform_factory(Basket,
+                                                      fields=('name',)),
+                prefix='basket', instance=the_basket)
+            fruits = combinedform.Subform(
+                django.forms.models.modelformset_factory(
+                    Fruit, fields=('name',), extra=1),
+                prefix='fruits')
+            save_lock = True
+            save_retries = 2
+            save_retry_delay = 0
+
+        formdata = {'basket-name': 'b2', 'fruits-TOTAL_FORMS': 3,
+                    'fruits-INITIAL_FORMS': 2, 'fruits-2-name': 'plum'}
+        for i, fruit in enumerate(reversed(fruits)):
+            formdata['fruits-{}-id'.format(i)] = fruit.pk
+            formdata['fruits-{}-name'.format(i)] = fruit.name + '!'
+        inst = TheForm(formdata)
+        self.assertTrue(inst.is_valid(), inst.errors)
+
+        Fruit.failures = 2
+        with combinedform.QueryCounter() as queries:
+            with django.test.utils.CaptureQueriesContext(
+                    django.db.connection) as captured:
+                inst.save()
+        self.assertEqual(0, Fruit.failures)
+        # every attempt locks the basket, then both fruits, in pk order
+        self.assertEqual(3, queries.count(TheForm, 'lock', 'testapp.Basket'))
+        self.assertEqual(3, queries.count(TheForm, 'lock', 'testapp.Fruit'))
+        fruit_locks = [q['sql'] for q in captured.captured_queries
+                       if 'SELECT' in q['sql'] and
+                       '"testapp_fruit"."id" IN' in q['sql']]
+        self.assertEqual(3, len(fruit_locks))
+        self.assertIn('ORDER BY "testapp_fruit"."id" ASC', fruit_locks[0])
+        self.assertEqual('b2', Basket.objects.get().name)
+        self.assertEqual(['pear!', 'apple!', 'plum'],
+                         list(Fruit.objects.order_by('pk')
+                              .values_list('name', flat=True)))
+
+        # errors which aren't transient, and the last failure, are raised
+        inst = TheForm(formdata)
+        self.assertTrue(inst.is_valid(), inst.errors)
+        Fruit.failures = 3
+        with self.assertRaises(django.db.OperationalError):
+            inst.save()
+        self.assertEqual(3, Fruit.objects.count())
+
+        # a failure inside the caller's transaction isn't retried, since the
+        # database may have rolled back the caller's writes along with it
+        inst = TheForm(formdata)
+        self.assertTrue(inst.is_valid(), inst.errors)
+        Fruit.failures = 1
+        with self.assertRaises(django.db.OperationalError):
+            with django.db.transaction.atomic():
+                inst.save()
+        self.assertEqual(0, Fruit.failures)
+
 
 class MainFormTest(unittest.TestCase):
     """Tests for ``main_form`` attribute of py:class:`CombinedForm`."""
@@ -592,6 +1943,30 @@ class MainFormTest(unittest.TestCase):
         form = MyCombinedForm()
         self.assertEqual(form.save(), MyModelForm().save())
 
+    def test_asave_uses_async_methods(self):
+        """asave() awaits the instances' async save methods."""
+
+        class Instance(object):
+            saved = False
+
+            def save(self):
+                raise AssertionError("sync save() called")
+
+            async def asave(self):
+                self.saved = True
+
+        instance = Instance()
+        MyModelForm = self.mockmodelform()
+        MyModelForm.return_value.save.return_value = instance
+
+        class MyCombinedForm(combinedform.CombinedForm):
+            form_a = combinedform.Subform(MyModelForm)
+            main_form = 'form_a'
+
+        form = MyCombinedForm()
+        self.assertIs(instance, run(form.asave()))
+        self.assertTrue(instance.saved)
+
     def test_save_returns_map_with_no_main(self):
         """If main_class is not set, save() returns a map."""
 